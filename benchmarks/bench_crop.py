@@ -0,0 +1,225 @@
+"""Benchmark the crop hot paths on synthetic images
+
+Each image size runs in its own process so peak RSS is measured per size.
+
+Usage:
+    python -m benchmarks.bench_crop
+    python -m benchmarks.bench_crop --sizes 2 12 --repeat 10
+    python -m benchmarks.bench_crop --save-baseline
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = (2, 12, 24, 50, 100)
+OPERATIONS = (
+    "load", "set_image", "update_display", "rotate_image", "get_cropped_image",
+    "materialize", "materialize_90", "save_png",
+)
+
+
+def image_dimensions(megapixels):
+    """Return a 3:2 width and height for the given number of megapixels"""
+    height = int(math.sqrt(megapixels * 1_000_000 / 1.5))
+    return int(height * 1.5), height
+
+
+def synthetic_image(megapixels, directory):
+    """Create (or reuse) a textured JPEG of the given size"""
+    from PySide6.QtCore import QRect
+    from PySide6.QtGui import QColor, QImage, QLinearGradient, QPainter
+
+    path = os.path.join(directory, f"synthetic_{megapixels}mp.jpg")
+    if os.path.exists(path):
+        return path
+
+    width, height = image_dimensions(megapixels)
+    image = QImage(width, height, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(30, 60, 120))
+    gradient.setColorAt(1, QColor(220, 180, 90))
+    painter.fillRect(image.rect(), gradient)
+    rng = random.Random(megapixels)
+    for _ in range(2000):
+        painter.fillRect(
+            QRect(rng.randrange(width), rng.randrange(height), rng.randrange(8, 200), rng.randrange(8, 200)),
+            QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 120),
+        )
+    painter.end()
+    image.save(path, "JPEG", 90)
+    return path
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+    return {
+        "p50_ms": pick(0.5) * 1000,
+        "p90_ms": pick(0.9) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed(samples, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def run_size(megapixels, repeat, directory):
+    """Time every operation for one image size in the current process"""
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    from PySide6.QtGui import QImageReader
+    from PySide6.QtWidgets import QApplication, QWidget
+
+    from core.export_queue import ExportSettings, encode_image
+    from widget.canvas import Canvas
+
+    # Qt refuses to decode images above 256 MB by default
+    QImageReader.setAllocationLimit(0)
+    app = QApplication.instance() or QApplication([])
+    path = synthetic_image(megapixels, directory)
+
+    parent = QWidget()
+    canvas = Canvas(parent)
+    canvas.resize(1560, 760)
+    samples = {name: [] for name in OPERATIONS}
+    width, height = image_dimensions(megapixels)
+    crop_width, crop_height = min(1920, width), min(1080, height)
+    output = os.path.join(directory, "bench_crop.png")
+
+    for _ in range(repeat):
+        image = timed(samples["load"], lambda: QImageReader(path).read())
+        timed(samples["set_image"], canvas.set_image, image)
+        for size in ((1200, 700), (1560, 760)):
+            canvas.resize(*size)
+            timed(samples["update_display"], canvas.update_display)
+        timed(samples["rotate_image"], canvas.rotate_image, 90)
+        # get_cropped_image only builds a CropView, the pixels are read when
+        # it is materialized: in place without rotation, as a copy with one
+        canvas.set_selection_size(crop_height, crop_width)
+        rotated = canvas.get_cropped_image()
+        timed(samples["materialize_90"], rotated.materialize)
+        canvas.rotate_image(-90)
+        canvas.set_selection_size(crop_width, crop_height)
+        cropped = timed(samples["get_cropped_image"], canvas.get_cropped_image)
+        image = timed(samples["materialize"], cropped.materialize)
+        timed(samples["save_png"], encode_image, image, output, ExportSettings())
+        app.processEvents()
+
+    return {
+        "megapixels": megapixels,
+        "dimensions": [width, height],
+        "operations": {name: percentiles(values) for name, values in samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of p50 latency against the baseline"""
+    regressions = []
+    for key, result in results["sizes"].items():
+        base = baseline.get("sizes", {}).get(key)
+        if not base:
+            continue
+        for name, stats in result["operations"].items():
+            base_stats = base["operations"].get(name)
+            if base_stats and stats["p50_ms"] > base_stats["p50_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{key} {name}: p50 {stats['p50_ms']:.1f} ms vs baseline {base_stats['p50_ms']:.1f} ms"
+                )
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{key} peak RSS: {result['peak_rss_mb']:.0f} MB vs baseline {base['peak_rss_mb']:.0f} MB"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark load, display, rotate, crop and save")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="image sizes in megapixels")
+    parser.add_argument("--repeat", type=int, default=5, help="iterations per size")
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="results JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "imagecrop_bench"))
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.single:
+        print(json.dumps(run_size(args.single, args.repeat, args.workdir)), flush=True)
+        # Skip interpreter teardown, PySide6 can crash while collecting Qt objects at exit
+        os._exit(0)
+
+    results = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    for megapixels in args.sizes:
+        command = [
+            sys.executable, "-m", "benchmarks.bench_crop",
+            "--single", str(megapixels), "--repeat", str(args.repeat), "--workdir", args.workdir,
+        ]
+        completed = subprocess.run(
+            command, cwd=os.path.dirname(BENCH_DIR), capture_output=True, text=True
+        )
+        if completed.returncode:
+            print(f"{megapixels} MP failed:\n{completed.stderr}", file=sys.stderr)
+            continue
+        result = json.loads(completed.stdout)
+        results["sizes"][f"{megapixels}MP"] = result
+        print(f"{megapixels} MP ({result['peak_rss_mb']:.0f} MB peak RSS)")
+        for name, stats in result["operations"].items():
+            print(f"  {name:<18} p50 {stats['p50_ms']:8.1f} ms   p90 {stats['p90_ms']:8.1f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Compare the NumPy resampling filters against QPixmap.scaled
+
+Usage:
+    python -m benchmarks.bench_resample
+    python -m benchmarks.bench_resample --repeat 10 --output benchmarks/resample.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.bench_crop import BENCH_DIR, percentiles, synthetic_image, timed
+
+# (name, source megapixels or size, target size): a shrink of a large crop
+# and an enlargement of a crop that is smaller than the target
+SCENARIOS = (
+    ("24mp_to_1080p", 24, (1920, 1080)),
+    ("720p_to_2160p", (1280, 720), (3840, 2160)),
+)
+
+
+def source_image(source, directory):
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QImage
+
+    if isinstance(source, tuple):
+        image = QImage(synthetic_image(2, directory))
+        return image.scaled(*source, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    return QImage(synthetic_image(source, directory))
+
+
+def run(repeat, directory):
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QImage, QImageReader, QPixmap
+    from PySide6.QtWidgets import QApplication
+
+    from core.crop_engine import anchor_rect, aspect_size
+    from core.resample import resample
+
+    QImageReader.setAllocationLimit(0)
+    app = QApplication.instance() or QApplication([])
+
+    results = {}
+    for name, source, (width, height) in SCENARIOS:
+        image = source_image(source, directory).convertToFormat(QImage.Format_RGB32)
+        # Crop by aspect ratio at the largest size first, as the resampled export mode does
+        crop_width, crop_height = aspect_size(image.width(), image.height(), width, height)
+        image = image.copy(anchor_rect(image.width(), image.height(), crop_width, crop_height))
+        pixmap = QPixmap.fromImage(image)
+
+        samples = {"lanczos": [], "area": [], "qpixmap_smooth": [], "qpixmap_fast": []}
+        for _ in range(repeat):
+            timed(samples["lanczos"], resample, image, width, height, "lanczos")
+            timed(samples["area"], resample, image, width, height, "area")
+            timed(
+                samples["qpixmap_smooth"], pixmap.scaled,
+                width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation,
+            )
+            timed(
+                samples["qpixmap_fast"], pixmap.scaled,
+                width, height, Qt.IgnoreAspectRatio, Qt.FastTransformation,
+            )
+            app.processEvents()
+        results[name] = {
+            "source": [crop_width, crop_height],
+            "target": [width, height],
+            "operations": {method: percentiles(values) for method, values in samples.items()},
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the resampling filters")
+    parser.add_argument("--repeat", type=int, default=5, help="iterations per scenario")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench_resample_") as directory:
+        results = run(args.repeat, directory)
+
+    for name, result in results.items():
+        source, target = result["source"], result["target"]
+        print(f"{name}: {source[0]}x{source[1]} -> {target[0]}x{target[1]}")
+        for method, stats in result["operations"].items():
+            print(f"  {method:<16} p50 {stats['p50_ms']:9.1f} ms   max {stats['max_ms']:9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"cpu_count": os.cpu_count(), "scenarios": results}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Content-aware crop placement from edge energy and color saliency
+
+The image is reduced to a small proxy and every proxy pixel gets an interest
+score. A summed-area table of the scores gives the total of any window in
+four lookups, so all window positions are scored at once in time linear in
+the proxy size, and the best one is scaled back to image coordinates.
+"""
+import numpy as np
+from PySide6.QtCore import QRect, Qt
+from PySide6.QtGui import QImage
+
+
+# Longest side of the proxy the search runs on
+PROXY_SIZE = 512
+
+# Weight of the color saliency term relative to the edge energy
+SALIENCY_WEIGHT = 0.5
+
+
+def proxy_image(image, size=PROXY_SIZE):
+    """Reduce a QImage or TiledImage to at most size pixels on the longest side"""
+    if not isinstance(image, QImage):
+        return image.proxy(size)
+    if max(image.width(), image.height()) <= size:
+        return image
+    # A nearest-neighbour step to twice the size keeps the smooth pass cheap
+    if max(image.width(), image.height()) > size * 2:
+        image = image.scaled(size * 2, size * 2, Qt.KeepAspectRatio, Qt.FastTransformation)
+    return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def _pixels(image):
+    image = image.convertToFormat(QImage.Format_RGB888)
+    return np.frombuffer(image.constBits(), np.uint8).reshape(
+        image.height(), image.bytesPerLine()
+    )[:, :image.width() * 3].reshape(image.height(), image.width(), 3).astype(np.float32)
+
+
+def interest_map(image):
+    """Score every pixel of a (small) QImage by edge energy plus color saliency"""
+    rgb = _pixels(image)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], np.float32)
+
+    energy = np.zeros_like(gray)
+    energy[:, 1:] += np.abs(np.diff(gray, axis=1))
+    energy[1:, :] += np.abs(np.diff(gray, axis=0))
+
+    # Colors far from the average color of the image stand out
+    saliency = np.linalg.norm(rgb - rgb.reshape(-1, 3).mean(axis=0), axis=2)
+
+    interest = energy / (energy.mean() + 1e-6)
+    interest += SALIENCY_WEIGHT * saliency / (saliency.mean() + 1e-6)
+    return interest
+
+
+def summed_area_table(values):
+    """Return the (h + 1, w + 1) integral image of a 2D array"""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def best_window(table, window_width, window_height):
+    """Return the (x, y) of the window with the largest sum in a summed-area table"""
+    sums = (
+        table[window_height:, window_width:]
+        - table[:-window_height, window_width:]
+        - table[window_height:, :-window_width]
+        + table[:-window_height, :-window_width]
+    )
+    y, x = np.unravel_index(np.argmax(sums), sums.shape)
+    return int(x), int(y)
+
+
+def suggest_crop(image, width, height, proxy=None):
+    """Return the most interesting width x height QRect of image
+
+    image is a QImage or TiledImage. When a proxy (any smaller QImage of the
+    same content, e.g. a pyramid level) is given, only image.width() and
+    image.height() are used, so a QSize will do.
+    """
+    image_width, image_height = image.width(), image.height()
+    if width > image_width or height > image_height:
+        raise ValueError(
+            f"Requested size ({width}x{height}) exceeds image size "
+            f"({image_width}x{image_height})"
+        )
+    proxy = proxy_image(proxy if proxy is not None else image)
+    scale_x = proxy.width() / image_width
+    scale_y = proxy.height() / image_height
+
+    window_width = min(proxy.width(), max(1, round(width * scale_x)))
+    window_height = min(proxy.height(), max(1, round(height * scale_y)))
+    x, y = best_window(summed_area_table(interest_map(proxy)), window_width, window_height)
+
+    # Center the full resolution window on the proxy window
+    center_x = (x + window_width / 2) / scale_x
+    center_y = (y + window_height / 2) / scale_y
+    left = max(0, min(round(center_x - width / 2), image_width - width))
+    top = max(0, min(round(center_y - height / 2), image_height - height))
+    return QRect(left, top, width, height)
@@ -0,0 +1,165 @@
+"""GUI-free crop primitives shared by the canvas and the batch tools"""
+import glob
+import os
+
+from PySide6.QtCore import Qt, QRect
+from PySide6.QtGui import QTransform
+
+from core.autocrop import suggest_crop
+from core.detection import DEFAULT_DETECTOR, default_cache, detect_file, subject_rect
+from core.tiled_image import open_source
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+
+ANCHORS = (
+    "center",
+    "top",
+    "bottom",
+    "left",
+    "right",
+    "top_left",
+    "top_right",
+    "bottom_left",
+    "bottom_right",
+)
+
+# Anchor that places the crop on the most interesting part of the image
+AUTO_ANCHOR = "auto"
+
+# Anchor that centers the crop on the subjects found by a detector
+SUBJECT_ANCHOR = "subject"
+
+
+def collect_images(source):
+    """Expand a directory or glob pattern into a sorted list of image files"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def parse_resolution(text):
+    """Parse a resolution string in the format widthxheight (e.g. 1920x1080)"""
+    width, height = map(int, text.strip().lower().split("x"))
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Resolution must be positive: {text}")
+    return width, height
+
+
+def anchor_rect(image_width, image_height, width, height, anchor="center"):
+    """Place a width x height crop inside the image according to the anchor"""
+    if anchor not in ANCHORS:
+        raise ValueError(f"Unknown anchor: {anchor}")
+    if width > image_width or height > image_height:
+        raise ValueError(
+            f"Requested size ({width}x{height}) exceeds image size "
+            f"({image_width}x{image_height})"
+        )
+
+    x = (image_width - width) // 2
+    y = (image_height - height) // 2
+    if "left" in anchor:
+        x = 0
+    elif "right" in anchor:
+        x = image_width - width
+    if "top" in anchor:
+        y = 0
+    elif "bottom" in anchor:
+        y = image_height - height
+
+    return QRect(x, y, width, height)
+
+
+def anchored_rect(image, width, height, anchor="center", path=None, detector=DEFAULT_DETECTOR):
+    """Place a width x height crop in a QImage or TiledImage by anchor or content
+
+    The subject anchor needs the path of the image to look up its cached
+    detections.
+    """
+    if anchor == AUTO_ANCHOR:
+        return suggest_crop(image, width, height)
+    if anchor == SUBJECT_ANCHOR:
+        boxes = detect_file(path, detector, default_cache(), image)
+        return subject_rect(image.width(), image.height(), width, height, boxes)
+    return anchor_rect(image.width(), image.height(), width, height, anchor)
+
+
+def aspect_size(image_width, image_height, width, height):
+    """Return the largest size with the aspect ratio of width x height that fits the image"""
+    if image_width * height >= image_height * width:
+        return max(1, min(image_width, round(image_height * width / height))), image_height
+    return image_width, max(1, min(image_height, round(image_width * height / width)))
+
+
+def map_display_rect(rect, image_origin, display_scale, image_width, image_height):
+    """Map a selection in widget coordinates to original image coordinates"""
+    relative_x = rect.x() - image_origin.x()
+    relative_y = rect.y() - image_origin.y()
+
+    original_x = int(relative_x / display_scale)
+    original_y = int(relative_y / display_scale)
+    original_width = int(rect.width() / display_scale)
+    original_height = int(rect.height() / display_scale)
+
+    original_x = max(0, min(original_x, image_width - original_width))
+    original_y = max(0, min(original_y, image_height - original_height))
+
+    return QRect(original_x, original_y, original_width, original_height)
+
+
+def rotated_size(width, height, rotation):
+    """Return the image size after a rotation by a multiple of 90 degrees"""
+    if rotation % 180:
+        return height, width
+    return width, height
+
+
+def source_rect(rect, rotation, image_width, image_height):
+    """Map a rect in rotated image coordinates back onto the unrotated source"""
+    x, y, width, height = rect.x(), rect.y(), rect.width(), rect.height()
+    rotation %= 360
+    if rotation == 90:
+        return QRect(y, image_height - x - width, height, width)
+    if rotation == 180:
+        return QRect(image_width - x - width, image_height - y - height, width, height)
+    if rotation == 270:
+        return QRect(image_width - y - height, x, height, width)
+    return QRect(rect)
+
+
+def transpose(image, rotation):
+    """Rotate an image by a multiple of 90 degrees without resampling"""
+    if not rotation % 360:
+        return image
+    return image.transformed(QTransform().rotate(rotation), Qt.FastTransformation)
+
+
+def crop_image(image, rect):
+    """Return the given rect of a QImage, QPixmap or TiledImage"""
+    return image.copy(rect)
+
+
+def output_name(path, width, height, extension="png"):
+    """Build the output file name for a cropped source file"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}_{width}x{height}.{extension}"
+
+
+def crop_file(path, width, height, anchor, output_dir, detector=DEFAULT_DETECTOR):
+    """Load an image from disk, crop it and save the result, returns the output path"""
+    image = open_source(path)
+    if image.isNull():
+        raise ValueError(f"Could not load image: {path}")
+
+    rect = anchored_rect(image, width, height, anchor, path, detector)
+    cropped = crop_image(image, rect)
+
+    filepath = os.path.join(output_dir, output_name(path, width, height))
+    if not cropped.save(filepath):
+        raise IOError(f"Could not save image: {filepath}")
+    return filepath
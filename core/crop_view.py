@@ -0,0 +1,133 @@
+"""Crops that share the pixel buffer of their source image"""
+import math
+
+from PySide6.QtCore import Qt, QRect
+from PySide6.QtGui import QImage
+
+from core import instrumentation
+from core.crop_engine import rotated_size, transpose
+
+
+def image_view(image, rect):
+    """Return a QImage over the rect of image without copying any pixels
+
+    The view points into the buffer of image, which must outlive it.
+    """
+    rect = rect.intersected(image.rect())
+    if image.depth() < 8:
+        return image.copy(rect)
+
+    bytes_per_line = image.bytesPerLine()
+    offset = rect.y() * bytes_per_line + rect.x() * (image.depth() // 8)
+    view = QImage(
+        image.constBits()[offset:],
+        rect.width(),
+        rect.height(),
+        bytes_per_line,
+        image.format(),
+    )
+    if image.format() == QImage.Format_Indexed8:
+        view.setColorTable(image.colorTable())
+    return view
+
+
+def render_region(source, pyramid, rect, width, height):
+    """Render the rect of a QImage or TiledImage into a width x height QImage
+
+    The pixels come from the smallest pyramid level that is still at least
+    as detailed as the result, from the source itself when the zoom exceeds
+    every level. Enlargements use nearest neighbour so single pixels stay
+    visible.
+    """
+    scale_x = width / rect.width()
+    scale_y = height / rect.height()
+    level = pyramid.level_for(
+        math.ceil(source.width() * scale_x), math.ceil(source.height() * scale_y)
+    )
+    if level.width() < source.width() * scale_x and not isinstance(source, QImage):
+        # Past the overview of a tiled source, read a subsampled region
+        image = source.region(rect, width * 2, height * 2)
+    else:
+        level_scale_x = level.width() / source.width()
+        level_scale_y = level.height() / source.height()
+        left = math.floor(rect.x() * level_scale_x)
+        top = math.floor(rect.y() * level_scale_y)
+        image = image_view(level, QRect(
+            left,
+            top,
+            max(1, math.ceil((rect.x() + rect.width()) * level_scale_x) - left),
+            max(1, math.ceil((rect.y() + rect.height()) * level_scale_y) - top),
+        ))
+    if (image.width(), image.height()) == (width, height):
+        # Never hand out a view, the result may outlive the source buffer
+        return image.copy()
+    mode = Qt.FastTransformation if scale_x > 1 else Qt.SmoothTransformation
+    return image.scaled(width, height, Qt.IgnoreAspectRatio, mode)
+
+
+class CropView:
+    """A rect of a source QImage or TiledImage plus a rotation, pixels are only copied on demand"""
+
+    def __init__(self, source, rect, rotation=0):
+        self.source = source
+        self.rect = QRect(rect)
+        self.rotation = rotation % 360
+
+    def width(self):
+        return self.size()[0]
+
+    def height(self):
+        return self.size()[1]
+
+    def size(self):
+        """Return the (width, height) of the crop as rotated"""
+        return rotated_size(self.rect.width(), self.rect.height(), self.rotation)
+
+    def image(self):
+        """Return the unrotated crop, a strided view when the source is a QImage"""
+        if isinstance(self.source, QImage):
+            return image_view(self.source, self.rect)
+        return self.source.region(self.rect)
+
+    def scaled(self, width, height, mode=Qt.SmoothTransformation):
+        """Return a QImage of the rotated crop fitted into width x height"""
+        fit_width, fit_height = rotated_size(width, height, self.rotation)
+        if isinstance(self.source, QImage):
+            image = self.image()
+        else:
+            # Only read a subsampled region of tiled sources, then smooth it down
+            image = self.source.region(self.rect, fit_width * 2, fit_height * 2)
+        return transpose(
+            image.scaled(fit_width, fit_height, Qt.KeepAspectRatio, mode),
+            self.rotation,
+        )
+
+    @instrumentation.timed("crop.preview")
+    def preview(self, width, height, pyramid):
+        """Return a QImage of the rotated crop fitted into width x height, read from pyramid
+
+        The rect is cut from the smallest pyramid level that still has enough
+        pixels for the result, so the cost depends on the preview size and not
+        on the size of the source.
+        """
+        fit_width, fit_height = rotated_size(width, height, self.rotation)
+        scale = min(fit_width / self.rect.width(), fit_height / self.rect.height())
+        return transpose(
+            render_region(
+                self.source,
+                pyramid,
+                self.rect,
+                max(1, round(self.rect.width() * scale)),
+                max(1, round(self.rect.height() * scale)),
+            ),
+            self.rotation,
+        )
+
+    @instrumentation.timed("crop.materialize")
+    def materialize(self):
+        """Return the crop ready for encoding
+
+        Without rotation this is the view itself, encoders read straight from
+        the source buffer. A rotation costs a single crop-sized copy.
+        """
+        return transpose(self.image(), self.rotation)
@@ -0,0 +1,210 @@
+"""Pluggable subject detectors with a persistent per-image cache
+
+Detectors run on a small proxy of the image and return boxes normalized to
+0..1, so a result is independent of the image and output resolution and can
+be reused by every later crop of the same file. Results are cached in SQLite
+keyed by a hash of the file contents and the detector name.
+
+The face detector needs OpenCV (pip install opencv-python-headless). It loads
+models/haarcascade_frontalface_default.xml if present and otherwise the
+cascade bundled with OpenCV. The saliency detector has no dependencies.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from PySide6.QtCore import QRect
+from PySide6.QtGui import QImage
+
+from core.autocrop import best_window, interest_map, proxy_image, summed_area_table
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+# Longest side of the proxy detectors run on
+DETECTION_PROXY_SIZE = 640
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "cache", "detections.db"
+)
+
+
+def _gray_pixels(image):
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    return np.frombuffer(image.constBits(), np.uint8).reshape(
+        image.height(), image.bytesPerLine()
+    )[:, :image.width()].copy()
+
+
+class SaliencyDetector:
+    """Report the most detailed third of the image as the subject"""
+
+    name = "saliency"
+
+    def detect(self, proxy):
+        window_width = max(1, proxy.width() // 3)
+        window_height = max(1, proxy.height() // 3)
+        table = summed_area_table(interest_map(proxy))
+        x, y = best_window(table, window_width, window_height)
+        return [(x, y, window_width, window_height, 1.0)]
+
+
+class FaceDetector:
+    """Frontal faces with an OpenCV Haar cascade"""
+
+    name = "face"
+    cascade_file = "haarcascade_frontalface_default.xml"
+
+    def __init__(self):
+        if cv2 is None:
+            raise RuntimeError("The face detector needs OpenCV: pip install opencv-python-headless")
+        path = os.path.join(MODELS_DIR, self.cascade_file)
+        if not os.path.exists(path):
+            path = os.path.join(cv2.data.haarcascades, self.cascade_file)
+        self.classifier = cv2.CascadeClassifier(path)
+        if self.classifier.empty():
+            raise RuntimeError(f"Could not load face model: {path}")
+
+    def detect(self, proxy):
+        gray = cv2.equalizeHist(_gray_pixels(proxy))
+        minimum = max(16, min(proxy.width(), proxy.height()) // 20)
+        faces = self.classifier.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(minimum, minimum)
+        )
+        return [(int(x), int(y), int(w), int(h), 1.0) for x, y, w, h in faces]
+
+
+DETECTORS = {
+    SaliencyDetector.name: SaliencyDetector,
+    FaceDetector.name: FaceDetector,
+}
+
+DEFAULT_DETECTOR = FaceDetector.name if cv2 is not None else SaliencyDetector.name
+
+_detectors = {}
+
+
+def get_detector(name=DEFAULT_DETECTOR):
+    """Return a shared detector instance, raises ValueError or RuntimeError"""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector: {name}")
+    if name not in _detectors:
+        _detectors[name] = DETECTORS[name]()
+    return _detectors[name]
+
+
+def file_hash(path):
+    """Hash the contents of a file, so renamed or copied files share detections"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """Normalized detection boxes in a SQLite database keyed by file hash"""
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS detections ("
+                "hash TEXT NOT NULL, detector TEXT NOT NULL, boxes TEXT NOT NULL, "
+                "PRIMARY KEY (hash, detector))"
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, digest, detector):
+        row = self._connection().execute(
+            "SELECT boxes FROM detections WHERE hash = ? AND detector = ?", (digest, detector)
+        ).fetchone()
+        return [tuple(box) for box in json.loads(row[0])] if row else None
+
+    def put(self, digest, detector, boxes):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?)",
+                (digest, detector, json.dumps(boxes)),
+            )
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Return the cache at DEFAULT_CACHE_PATH, opened once per process"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DetectionCache()
+    return _default_cache
+
+
+def detect_image(image, detector):
+    """Run a detector on a proxy of a QImage or TiledImage, returns normalized boxes"""
+    proxy = proxy_image(image, DETECTION_PROXY_SIZE)
+    width, height = proxy.width(), proxy.height()
+    return [
+        (x / width, y / height, w / width, h / height, score)
+        for x, y, w, h, score in detector.detect(proxy)
+    ]
+
+
+def detect_file(path, detector_name=DEFAULT_DETECTOR, cache=None, image=None):
+    """Return the cached boxes of a file, detecting them on a miss
+
+    Pass the decoded image when it is already at hand to skip a decode.
+    """
+    digest = file_hash(path)
+    if cache is not None:
+        boxes = cache.get(digest, detector_name)
+        if boxes is not None:
+            return boxes
+    if image is None:
+        image = QImage(path)
+        if image.isNull():
+            raise ValueError(f"Could not load image: {path}")
+    boxes = detect_image(image, get_detector(detector_name))
+    if cache is not None:
+        cache.put(digest, detector_name, boxes)
+    return boxes
+
+
+def subject_rect(image_width, image_height, width, height, boxes):
+    """Center a width x height crop on the detected subjects
+
+    The crop is centered on the area weighted center of all boxes, falling
+    back to the image center when nothing was detected.
+    """
+    if width > image_width or height > image_height:
+        raise ValueError(
+            f"Requested size ({width}x{height}) exceeds image size "
+            f"({image_width}x{image_height})"
+        )
+    weights = [w * h * score for _, _, w, h, score in boxes]
+    if boxes and sum(weights) > 0:
+        total = sum(weights)
+        center_x = sum((x + w / 2) * weight for (x, _, w, _, _), weight in zip(boxes, weights)) / total
+        center_y = sum((y + h / 2) * weight for (_, y, _, h, _), weight in zip(boxes, weights)) / total
+    else:
+        center_x = center_y = 0.5
+    left = max(0, min(round(center_x * image_width - width / 2), image_width - width))
+    top = max(0, min(round(center_y * image_height - height / 2), image_height - height))
+    return QRect(left, top, width, height)
@@ -0,0 +1,151 @@
+"""Streaming image downloads on a pooled keep-alive session"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage
+
+from core import instrumentation
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """Raised when a download is rejected or cancelled"""
+
+
+def create_session(pool_size=4):
+    """Create a requests session that keeps connections alive between downloads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "ImageCropTool"
+    return session
+
+
+def fetch(session, url, max_bytes=DEFAULT_MAX_BYTES, timeout=10, progress=None,
+          cancelled=None, cache=None):
+    """Stream a URL into memory in chunks, enforcing a size cap"""
+    headers = {}
+    if cancelled and cancelled.is_set():
+        raise DownloadError("Download cancelled")
+    if cache:
+        data = cache.get(url)
+        if data is not None:
+            return data
+        headers = cache.conditional_headers(url)
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304 and cache:
+            data = cache.revalidate(url, response.headers)
+            if data is not None:
+                return data
+            return fetch(session, url, max_bytes, timeout, progress, cancelled)
+        response.raise_for_status()
+        total = int(response.headers.get("Content-Length") or 0)
+        if total > max_bytes:
+            raise DownloadError(f"Image is too large ({total} bytes, limit {max_bytes})")
+
+        data = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if cancelled and cancelled.is_set():
+                raise DownloadError("Download cancelled")
+            data += chunk
+            if len(data) > max_bytes:
+                raise DownloadError(f"Image is larger than the {max_bytes} byte limit")
+            if progress:
+                progress(len(data), total)
+        data = bytes(data)
+
+    if cache:
+        cache.store(url, data, response.headers)
+    return data
+
+
+class _DownloadSignals(QObject):
+    progress = Signal(int, int, int)
+    finished = Signal(int, str, QImage)
+    failed = Signal(int, str, str)
+
+
+class _DownloadTask(QRunnable):
+    def __init__(self, request_id, url, downloader):
+        super().__init__()
+        self.request_id = request_id
+        self.url = url
+        self.session = downloader.session
+        self.max_bytes = downloader.max_bytes
+        self.timeout = downloader.timeout
+        self.cache = downloader.cache
+        self.cancelled = downloader._cancelled
+        self.signals = downloader._signals
+
+    def _progress(self, received, total):
+        self.signals.progress.emit(self.request_id, received, total)
+
+    def run(self):
+        try:
+            with instrumentation.span("download"):
+                data = fetch(
+                    self.session, self.url, self.max_bytes, self.timeout,
+                    self._progress, self.cancelled, self.cache,
+                )
+            instrumentation.count("download.bytes", len(data))
+            image = QImage.fromData(data)
+            if image.isNull():
+                raise DownloadError(f"Failed to load image from: {self.url}")
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, self.url, str(e))
+        else:
+            self.signals.finished.emit(self.request_id, self.url, image)
+
+
+class ImageDownloader(QObject):
+    """Download and decode images off the GUI thread, only the latest request is reported"""
+
+    progress = Signal(int, int)
+    finished = Signal(str, QImage)
+    failed = Signal(str, str)
+
+    def __init__(self, parent=None, session=None, max_bytes=DEFAULT_MAX_BYTES, timeout=10,
+                 cache=None):
+        super().__init__(parent)
+        self.session = session or create_session()
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self._request_id = 0
+        self._cancelled = threading.Event()
+
+        self._signals = _DownloadSignals(self)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def download(self, url):
+        """Start downloading a URL, cancelling any download still in progress"""
+        self.cancel()
+        self._request_id += 1
+        self._cancelled = threading.Event()
+        self.pool.start(_DownloadTask(self._request_id, url, self))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _on_progress(self, request_id, received, total):
+        if request_id == self._request_id:
+            self.progress.emit(received, total)
+
+    def _on_finished(self, request_id, url, image):
+        if request_id == self._request_id and not self._cancelled.is_set():
+            self.finished.emit(url, image)
+
+    def _on_failed(self, request_id, url, message):
+        if request_id == self._request_id and not self._cancelled.is_set():
+            self.failed.emit(url, message)
@@ -0,0 +1,163 @@
+"""Background encoding of cropped images"""
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage, QImageWriter
+
+from core import instrumentation
+from core.crop_engine import aspect_size
+from core.fanout import downscale_chain
+from core.resample import resample
+
+
+EXPORT_FORMATS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WebP": "webp",
+}
+
+
+class ExportSettings:
+    """Encoder settings for exported images"""
+
+    def __init__(self, format="PNG", quality=90, png_compression=6):
+        self.format = format if format in EXPORT_FORMATS else "PNG"
+        self.quality = max(0, min(int(quality), 100))
+        self.png_compression = max(0, min(int(png_compression), 9))
+
+    @property
+    def extension(self):
+        return EXPORT_FORMATS[self.format]
+
+
+@instrumentation.timed("encode")
+def encode_image(image, filepath, settings):
+    """Encode a QImage to disk with the given settings"""
+    writer = QImageWriter(filepath, settings.extension.encode())
+    if settings.format == "PNG":
+        # Qt's PNG writer derives the zlib level from quality as (100 - q) * 9 / 91
+        writer.setQuality(100 - (settings.png_compression * 91 + 8) // 9)
+    else:
+        writer.setQuality(settings.quality)
+    if not writer.write(image):
+        raise IOError(f"Could not save image {filepath}: {writer.errorString()}")
+
+
+class _ExportSignals(QObject):
+    finished = Signal(str)
+    failed = Signal(str, str)
+
+
+class _ExportTask(QRunnable):
+    def __init__(self, image, filepath, settings, signals, size=None, resample_filter="lanczos"):
+        super().__init__()
+        self.image = image
+        self.filepath = filepath
+        self.settings = settings
+        self.signals = signals
+        self.size = size
+        self.resample_filter = resample_filter
+
+    def run(self):
+        try:
+            image = self.image
+            if not isinstance(image, QImage):
+                image = image.materialize()
+            if self.size:
+                # A selection resized by hand may not match the target aspect
+                # ratio, trim it around the center instead of stretching it
+                width, height = aspect_size(image.width(), image.height(), *self.size)
+                if (width, height) != (image.width(), image.height()):
+                    image = image.copy(
+                        (image.width() - width) // 2, (image.height() - height) // 2, width, height
+                    )
+                image = resample(image, *self.size, self.resample_filter)
+            encode_image(image, self.filepath, self.settings)
+        except Exception as e:
+            self.signals.failed.emit(self.filepath, str(e))
+        else:
+            self.signals.finished.emit(self.filepath)
+
+
+class _FanoutTask(QRunnable):
+    def __init__(self, image, outputs, settings, pool, signals):
+        super().__init__()
+        self.image = image
+        self.outputs = outputs
+        self.settings = settings
+        self.pool = pool
+        self.signals = signals
+
+    def run(self):
+        try:
+            image = self.image
+            if not isinstance(image, QImage):
+                image = image.materialize()
+            levels = downscale_chain(
+                image, [(filepath, width, height) for width, height, filepath in self.outputs]
+            )
+        except Exception as e:
+            for _, _, filepath in self.outputs:
+                self.signals.failed.emit(filepath, str(e))
+            return
+        # The levels are independent from here on, encode them side by side
+        for filepath, level in levels:
+            self.pool.start(_ExportTask(level, filepath, self.settings, self.signals))
+
+
+class ExportQueue(QObject):
+    """Queue of crops encoded on background workers"""
+
+    finished = Signal(str)
+    failed = Signal(str, str)
+    progress = Signal(int, int, int)
+
+    def __init__(self, parent=None, max_workers=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_workers:
+            self.pool.setMaxThreadCount(max_workers)
+        self.queued = 0
+        self.completed = 0
+        self.failures = 0
+
+        self._signals = _ExportSignals(self)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def pending(self):
+        return self.queued - self.completed - self.failures
+
+    def enqueue(self, image, filepath, settings, size=None, resample_filter="lanczos"):
+        """Queue a QImage or CropView for encoding
+
+        A CropView keeps its source alive and is materialized on the worker.
+        With size, the image is resampled to exactly (width, height) first.
+        """
+        self.queued += 1
+        self.pool.start(
+            _ExportTask(image, filepath, settings, self._signals, size, resample_filter)
+        )
+        self.progress.emit(self.completed, self.failures, self.queued)
+
+    def enqueue_fanout(self, image, outputs, settings):
+        """Queue one crop for several sizes, outputs are (width, height, filepath)
+
+        The crop is materialized once and every size is scaled from the next
+        larger one before the outputs are encoded in parallel.
+        """
+        outputs = sorted(outputs, key=lambda output: output[0] * output[1], reverse=True)
+        self.queued += len(outputs)
+        self.pool.start(_FanoutTask(image, outputs, settings, self.pool, self._signals))
+        self.progress.emit(self.completed, self.failures, self.queued)
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _on_finished(self, filepath):
+        self.completed += 1
+        self.finished.emit(filepath)
+        self.progress.emit(self.completed, self.failures, self.queued)
+
+    def _on_failed(self, filepath, message):
+        self.failures += 1
+        self.failed.emit(filepath, message)
+        self.progress.emit(self.completed, self.failures, self.queued)
@@ -0,0 +1,93 @@
+"""Produce one crop at several output resolutions from a single decode"""
+import os
+import time
+
+from PySide6.QtCore import Qt
+
+from core.crop_engine import anchored_rect, crop_image, parse_resolution
+from core.detection import DEFAULT_DETECTOR
+from core.tiled_image import open_source
+
+
+FANOUT_PRESETS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+}
+
+DEFAULT_TEMPLATE = "{stem}_{label}.{ext}"
+
+
+def parse_sizes(names):
+    """Turn preset names or widthxheight strings into (label, width, height), largest first"""
+    sizes = []
+    for name in names:
+        name = name.strip()
+        if name in FANOUT_PRESETS:
+            width, height = FANOUT_PRESETS[name]
+        else:
+            width, height = parse_resolution(name)
+            name = f"{width}x{height}"
+        sizes.append((name, width, height))
+    return sorted(set(sizes), key=lambda size: size[1] * size[2], reverse=True)
+
+
+def fit_exact(image, width, height):
+    """Scale an image to exactly width x height, trimming the edges if the aspect differs"""
+    if image.width() == width and image.height() == height:
+        return image
+    scaled = image.scaled(width, height, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+    if scaled.width() == width and scaled.height() == height:
+        return scaled
+    x = (scaled.width() - width) // 2
+    y = (scaled.height() - height) // 2
+    return scaled.copy(x, y, width, height)
+
+
+def downscale_chain(image, sizes):
+    """Return [(label, image)] for sizes ordered largest first
+
+    Each level is scaled from the previous, nearest larger one rather than
+    from the full crop, so the smooth filter only ever reduces a little.
+    """
+    levels = []
+    level = image
+    for label, width, height in sizes:
+        if width > image.width() or height > image.height():
+            raise ValueError(
+                f"Requested size ({width}x{height}) exceeds crop size "
+                f"({image.width()}x{image.height()})"
+            )
+        level = fit_exact(level, width, height)
+        levels.append((label, level))
+    return levels
+
+
+def fanout_name(template, stem, label, width, height, extension="png", timestamp=None):
+    """Fill a naming template, fields: stem, label, width, height, ext, timestamp"""
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+    return template.format(
+        stem=stem, label=label, width=width, height=height, ext=extension, timestamp=timestamp
+    )
+
+
+def fanout_file(path, sizes, anchor, output_dir, template=DEFAULT_TEMPLATE, detector=DEFAULT_DETECTOR):
+    """Crop a file once at the largest size and save every size, returns the output paths"""
+    image = open_source(path)
+    if image.isNull():
+        raise ValueError(f"Could not load image: {path}")
+
+    _, width, height = sizes[0]
+    rect = anchored_rect(image, width, height, anchor, path, detector)
+    cropped = crop_image(image, rect)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    outputs = []
+    for (label, width, height), (_, level) in zip(sizes, downscale_chain(cropped, sizes)):
+        filepath = os.path.join(output_dir, fanout_name(template, stem, label, width, height))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        if not level.save(filepath):
+            raise IOError(f"Could not save image: {filepath}")
+        outputs.append(filepath)
+    return outputs
@@ -0,0 +1,145 @@
+"""Background image decoding with a fast downscaled preview"""
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QImage, QImageReader
+
+from core import instrumentation
+from core.pyramid import ImagePyramid
+from core.tiled_image import ALLOCATION_LIMIT_MB, open_tiled
+
+
+def image_reader(path):
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    return reader
+
+
+@instrumentation.timed("decode")
+def decode_image(path):
+    """Decode a file in full, very large TIFFs are opened as a TiledImage"""
+    tiled = open_tiled(path)
+    if tiled:
+        return tiled
+    QImageReader.setAllocationLimit(ALLOCATION_LIMIT_MB)
+    reader = image_reader(path)
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(reader.errorString())
+    return image
+
+
+class _LoaderSignals(QObject):
+    preview_ready = Signal(int, QImage)
+    image_ready = Signal(int, object, object)
+    failed = Signal(int, str)
+
+
+class _LoadTask(QRunnable):
+    """Decode one file, emitting a scaled preview before the full image
+
+    The display pyramid is built here as well, for tiled sources this reads
+    the whole file and must stay off the GUI thread.
+    """
+
+    def __init__(self, request_id, path, preview_size, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.path = path
+        self.preview_size = preview_size
+        self.signals = signals
+
+    def run(self):
+        tiled = open_tiled(self.path)
+        if tiled:
+            # One pass over the file for the overview, the preview is scaled from it
+            pyramid = ImagePyramid.for_source(tiled)
+            if self.preview_size:
+                self.signals.preview_ready.emit(
+                    self.request_id,
+                    pyramid.base.scaled(
+                        self.preview_size, self.preview_size, Qt.KeepAspectRatio, Qt.SmoothTransformation
+                    ),
+                )
+            self.signals.image_ready.emit(self.request_id, tiled, pyramid)
+            return
+
+        reader = image_reader(self.path)
+        size = reader.size()
+        if (
+            self.preview_size
+            and size.isValid()
+            and max(size.width(), size.height()) > self.preview_size
+        ):
+            # JPEG decodes at 1/2, 1/4 or 1/8 scale directly from the DCT
+            # coefficients, so the preview costs a fraction of the full decode
+            reader.setScaledSize(
+                size.scaled(self.preview_size, self.preview_size, Qt.KeepAspectRatio)
+            )
+            with instrumentation.span("decode.preview"):
+                preview = reader.read()
+            if not preview.isNull():
+                self.signals.preview_ready.emit(self.request_id, preview)
+            reader = image_reader(self.path)
+
+        with instrumentation.span("decode"):
+            image = reader.read()
+        if image.isNull():
+            self.signals.failed.emit(self.request_id, reader.errorString())
+        else:
+            self.signals.image_ready.emit(self.request_id, image, ImagePyramid.for_source(image))
+
+
+class ImageLoader(QObject):
+    """Decode images on a worker thread, only the latest request is reported
+
+    image_ready carries a QImage, or a TiledImage for very large TIFFs, and
+    its display pyramid.
+    """
+
+    preview_ready = Signal(QImage)
+    image_ready = Signal(object, object)
+    failed = Signal(str)
+
+    def __init__(self, parent=None, preview_size=1024):
+        """A preview_size of None skips the preview and only decodes in full"""
+        super().__init__(parent)
+        QImageReader.setAllocationLimit(ALLOCATION_LIMIT_MB)
+        self.preview_size = preview_size
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self._request_id = 0
+        self._pending = False
+
+        self._signals = _LoaderSignals(self)
+        self._signals.preview_ready.connect(self._on_preview_ready)
+        self._signals.image_ready.connect(self._on_image_ready)
+        self._signals.failed.connect(self._on_failed)
+
+    def is_loading(self):
+        return self._pending
+
+    def load(self, path):
+        """Start decoding a file, superseding any load still in progress"""
+        self._request_id += 1
+        self._pending = True
+        self.pool.start(
+            _LoadTask(self._request_id, path, self.preview_size, self._signals)
+        )
+
+    def cancel(self):
+        """Ignore the result of the load in progress"""
+        self._request_id += 1
+        self._pending = False
+
+    def _on_preview_ready(self, request_id, image):
+        if request_id == self._request_id and self._pending:
+            self.preview_ready.emit(image)
+
+    def _on_image_ready(self, request_id, image, pyramid):
+        if request_id == self._request_id:
+            self._pending = False
+            self.image_ready.emit(image, pyramid)
+
+    def _on_failed(self, request_id, message):
+        if request_id == self._request_id:
+            self._pending = False
+            self.failed.emit(message)
@@ -0,0 +1,176 @@
+"""Lightweight timers and counters for the hot paths
+
+Instrumentation is off by default. While it is off, span() hands out one
+shared no-op context manager and timed() wrappers cost a single flag check,
+so instrumented code runs at practically full speed. When it is on, every
+span updates per-operation statistics and is kept in a bounded buffer that
+can be written out as a Chrome trace (chrome://tracing or ui.perfetto.dev).
+
+Set IMAGECROP_TRACE=path/to/trace.json to enable it from the start and
+write the trace when the process exits.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+
+# Spans kept for the trace export, the oldest are dropped first
+MAX_EVENTS = 100_000
+
+_enabled = False
+_lock = threading.Lock()
+_events = deque(maxlen=MAX_EVENTS)
+_stats = {}
+_counters = {}
+_origin = time.perf_counter()
+
+
+class OperationStats:
+    """Count, total, last and worst duration of one operation in seconds"""
+
+    __slots__ = ("count", "total", "last", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, start, duration):
+    """Add one measured span, start is a time.perf_counter() value"""
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = OperationStats()
+        stats.count += 1
+        stats.total += duration
+        stats.last = duration
+        stats.max = max(stats.max, duration)
+        _events.append((name, start, duration, threading.get_ident()))
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing the enclosed block as name"""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator timing every call of a function as name"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Add value to a counter, e.g. bytes downloaded or cache hits"""
+    if not _enabled:
+        return
+    with _lock:
+        total = _counters.get(name, 0) + value
+        _counters[name] = total
+        _events.append((name, time.perf_counter(), None, total))
+
+
+def stats():
+    """Return a snapshot {name: OperationStats} of the timed operations"""
+    with _lock:
+        snapshot = {}
+        for name, stats in _stats.items():
+            copy = OperationStats()
+            copy.count, copy.total, copy.last, copy.max = stats.count, stats.total, stats.last, stats.max
+            snapshot[name] = copy
+        return snapshot
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _counters.clear()
+
+
+def export_chrome_trace(path):
+    """Write the buffered spans and counters in the Chrome trace event format"""
+    pid = os.getpid()
+    trace = []
+    with _lock:
+        events = list(_events)
+    for name, start, duration, value in events:
+        timestamp = (start - _origin) * 1_000_000
+        if duration is None:
+            trace.append({"name": name, "ph": "C", "ts": timestamp, "pid": pid, "args": {"value": value}})
+        else:
+            trace.append({
+                "name": name, "ph": "X", "ts": timestamp, "dur": duration * 1_000_000,
+                "pid": pid, "tid": value,
+            })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+    return len(trace)
+
+
+_trace_path = os.environ.get("IMAGECROP_TRACE")
+if _trace_path:
+    enable()
+    atexit.register(export_chrome_trace, _trace_path)
@@ -0,0 +1,61 @@
+"""Crop previews: an instant one from the display pyramid, refined in the background"""
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage
+
+from core import instrumentation
+
+
+class _RefineSignals(QObject):
+    refined = Signal(int, QImage)
+
+
+class _RefineTask(QRunnable):
+    """Scale a crop from the full resolution source"""
+
+    def __init__(self, request_id, view, width, height, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.view = view
+        self.width = width
+        self.height = height
+        self.signals = signals
+
+    def run(self):
+        with instrumentation.span("crop.refine"):
+            image = self.view.scaled(self.width, self.height)
+        self.signals.refined.emit(self.request_id, image)
+
+
+class PreviewRenderer(QObject):
+    """Render crop previews, only the latest request is refined
+
+    render() returns a preview cut from a pyramid level right away and
+    queues the same preview scaled from the full resolution source. refined
+    is emitted with it unless a newer request came in meanwhile.
+    """
+
+    refined = Signal(QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._request_id = 0
+        self._signals = _RefineSignals(self)
+        self._signals.refined.connect(self._on_refined)
+
+    def render(self, view, width, height, pyramid):
+        """Return a preview of a CropView fitted into width x height"""
+        self._request_id += 1
+        self.pool.clear()
+        self.pool.start(_RefineTask(self._request_id, view, width, height, self._signals))
+        return view.preview(width, height, pyramid)
+
+    def cancel(self):
+        """Drop the refinement in progress"""
+        self._request_id += 1
+        self.pool.clear()
+
+    def _on_refined(self, request_id, image):
+        if request_id == self._request_id and not image.isNull():
+            self.refined.emit(image)
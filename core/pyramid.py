@@ -0,0 +1,45 @@
+"""Mip pyramid of an image for fast display scaling"""
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage
+
+
+# Longest side of the overview used to display tiled sources
+TILED_PROXY_SIZE = 4096
+
+
+class ImagePyramid:
+    """Cached half, quarter, ... levels of a QImage or QPixmap"""
+
+    def __init__(self, image, min_size=256):
+        self.levels = [image]
+        level = image
+        while level.width() // 2 >= min_size and level.height() // 2 >= min_size:
+            level = level.scaled(
+                level.width() // 2,
+                level.height() // 2,
+                Qt.IgnoreAspectRatio,
+                Qt.SmoothTransformation,
+            )
+            self.levels.append(level)
+
+    @classmethod
+    def for_source(cls, source):
+        """Build the pyramid of a QImage, or of an overview of a TiledImage"""
+        if isinstance(source, QImage):
+            return cls(source)
+        return cls(source.proxy(TILED_PROXY_SIZE))
+
+    def size_in_bytes(self):
+        """Return the memory held by the downscaled levels"""
+        return sum(level.sizeInBytes() for level in self.levels[1:])
+
+    @property
+    def base(self):
+        return self.levels[0]
+
+    def level_for(self, width, height):
+        """Return the smallest level that is still at least width x height"""
+        for level in reversed(self.levels):
+            if level.width() >= width and level.height() >= height:
+                return level
+        return self.levels[0]
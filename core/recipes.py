@@ -0,0 +1,259 @@
+"""Crop recipes: record how each image was cropped and replay it later
+
+A recipe is a small JSON file mapping each source image to the rotation and
+the crop rect used for it. The rect is stored normalized to the rotated image
+size, so it does not depend on the display scale or on a preview decode.
+
+Usage:
+    python -m core.recipes output/recipe.json
+    python -m core.recipes output/recipe.json --resolution 1280x720 -j 8
+    python -m core.recipes recipe.json --source-dir moved_shoot/
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PySide6.QtCore import QObject, QRect, QRunnable, QThreadPool, Signal
+
+from core.crop_engine import (
+    aspect_size, crop_image, output_name, parse_resolution, rotated_size, source_rect, transpose
+)
+from core.resample import resample
+from core.tiled_image import open_source
+
+
+RECIPE_VERSION = 1
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "output")
+
+
+class CropRecipe:
+    """Per-image rotation, normalized crop rect and output size"""
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def record(self, path, rotation, rect, image_width, image_height, width, height,
+               resample_filter=None):
+        """Record a crop given as a QRect in rotated image coordinates
+
+        With a resample filter the crop was resampled to width x height
+        rather than cut at native pixels.
+        """
+        entry = {
+            "rotation": rotation % 360,
+            "rect": [
+                round(rect.x() / image_width, 6),
+                round(rect.y() / image_height, 6),
+                round(rect.width() / image_width, 6),
+                round(rect.height() / image_height, 6),
+            ],
+            "size": [width, height],
+        }
+        if resample_filter:
+            entry["filter"] = resample_filter
+        self.entries[os.path.abspath(path)] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, filepath):
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        with open(filepath, "w") as file:
+            json.dump({"version": RECIPE_VERSION, "images": self.entries}, file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, filepath):
+        """Read a recipe file, raises ValueError if it is not a recipe"""
+        with open(filepath, "r") as file:
+            data = json.load(file)
+        if not isinstance(data, dict) or data.get("version") != RECIPE_VERSION:
+            raise ValueError(f"Not a version {RECIPE_VERSION} crop recipe: {filepath}")
+        return cls(data.get("images", {}))
+
+
+def resolve_path(path, source_dir=None):
+    """Find a recorded image, looking it up by name in source_dir if given"""
+    if source_dir:
+        return os.path.join(source_dir, os.path.basename(path))
+    return path
+
+
+def place_crop(entry, image_width, image_height, width=None, height=None):
+    """Return the crop rect of an entry in rotated image coordinates
+
+    Without a new size the recorded rect is cut as it was. Given a new size,
+    the recorded rect only fixes where the crop is centered, so a set can be
+    re-exported at another resolution without placing each crop again.
+    Resampled entries keep the recorded crop area instead, trimmed to the
+    aspect ratio of the output size.
+    """
+    x, y, w, h = entry["rect"]
+    if (width is None or height is None) and not entry.get("filter"):
+        width, height = entry["size"]
+        left = max(0, min(round(x * image_width), image_width - width))
+        top = max(0, min(round(y * image_height), image_height - height))
+        if width > image_width or height > image_height:
+            raise ValueError(
+                f"Requested size ({width}x{height}) exceeds image size "
+                f"({image_width}x{image_height})"
+            )
+        return QRect(left, top, width, height)
+    if width is None or height is None:
+        width, height = entry["size"]
+    if entry.get("filter"):
+        width, height = aspect_size(
+            max(1, round(w * image_width)), max(1, round(h * image_height)), width, height
+        )
+    if width > image_width or height > image_height:
+        raise ValueError(
+            f"Requested size ({width}x{height}) exceeds image size "
+            f"({image_width}x{image_height})"
+        )
+    center_x = (x + w / 2) * image_width
+    center_y = (y + h / 2) * image_height
+    left = max(0, min(round(center_x - width / 2), image_width - width))
+    top = max(0, min(round(center_y - height / 2), image_height - height))
+    return QRect(left, top, width, height)
+
+
+def apply_entry(path, entry, output_dir, width=None, height=None):
+    """Crop one image as recorded and save it, returns the output path"""
+    image = open_source(path)
+    if image.isNull():
+        raise ValueError(f"Could not load image: {path}")
+
+    rotation = entry.get("rotation", 0)
+    image_width, image_height = rotated_size(image.width(), image.height(), rotation)
+    rect = place_crop(entry, image_width, image_height, width, height)
+    cropped = transpose(
+        crop_image(image, source_rect(rect, rotation, image.width(), image.height())),
+        rotation,
+    )
+    if entry.get("filter"):
+        if width is None or height is None:
+            width, height = entry["size"]
+        cropped = resample(cropped, width, height, entry["filter"])
+
+    filepath = os.path.join(output_dir, output_name(path, cropped.width(), cropped.height()))
+    if not cropped.save(filepath):
+        raise IOError(f"Could not save image: {filepath}")
+    return filepath
+
+
+def _replay_job(job):
+    path, entry, output_dir, width, height = job
+    try:
+        return path, apply_entry(path, entry, output_dir, width, height), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def replay_recipe(recipe, output_dir=DEFAULT_OUTPUT_DIR, width=None, height=None,
+                  source_dir=None, workers=None, mp_context=None):
+    """Apply a recipe across a process pool, returns (succeeded, failed, seconds)"""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    jobs = [
+        (resolve_path(path, source_dir), entry, output_dir, width, height)
+        for path, entry in recipe.entries.items()
+    ]
+    chunksize = max(1, len(jobs) // (workers * 4))
+
+    succeeded, failed = [], []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        for path, output, error in executor.map(_replay_job, jobs, chunksize=chunksize):
+            if error:
+                failed.append((path, error))
+            else:
+                succeeded.append(output)
+    return succeeded, failed, time.perf_counter() - start
+
+
+class _ReplaySignals(QObject):
+    finished = Signal(list, list, float)
+
+
+class _ReplayTask(QRunnable):
+    def __init__(self, recipe, output_dir, width, height, signals):
+        super().__init__()
+        self.recipe = recipe
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.signals = signals
+
+    def run(self):
+        # Forking a process that runs a Qt event loop is unsafe, spawn fresh workers
+        succeeded, failed, seconds = replay_recipe(
+            self.recipe, self.output_dir, self.width, self.height,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.signals.finished.emit(succeeded, failed, seconds)
+
+
+class RecipeReplayer(QObject):
+    """Replay a recipe from the GUI without blocking the event loop"""
+
+    finished = Signal(list, list, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._signals = _ReplaySignals(self)
+        self._signals.finished.connect(self.finished)
+
+    def replay(self, recipe, output_dir=DEFAULT_OUTPUT_DIR, width=None, height=None):
+        self.pool.start(_ReplayTask(recipe, output_dir, width, height, self._signals))
+
+    def is_running(self):
+        return self.pool.activeThreadCount() > 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a crop recipe across its images")
+    parser.add_argument("recipe", help="recipe file written by the GUI")
+    parser.add_argument("-r", "--resolution", default=None, help="re-export at this resolution, e.g. 1280x720")
+    parser.add_argument("-s", "--source-dir", default=None, help="look the images up by name in this directory")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_DIR, help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: core count)")
+    args = parser.parse_args(argv)
+
+    width = height = None
+    if args.resolution:
+        try:
+            width, height = parse_resolution(args.resolution)
+        except ValueError:
+            parser.error("resolution must be in format: widthxheight (e.g. 1920x1080)")
+
+    try:
+        recipe = CropRecipe.load(args.recipe)
+    except (OSError, ValueError) as e:
+        print(f"Could not read recipe: {e}", file=sys.stderr)
+        return 1
+    if not len(recipe):
+        print(f"Recipe {args.recipe} is empty")
+        return 1
+
+    succeeded, failed, seconds = replay_recipe(
+        recipe, args.output, width, height, args.source_dir, args.workers
+    )
+    for path, error in failed:
+        print(f"Failed: {path}: {error}", file=sys.stderr)
+
+    rate = len(succeeded) / seconds if seconds else 0.0
+    print(
+        f"Replayed {len(succeeded)}/{len(recipe)} crops in {seconds:.2f}s "
+        f"({rate:.1f} images/s)"
+    )
+    return 0 if not failed else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""A set of images opened together with an LRU cache of decoded images"""
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage
+
+from core.image_loader import ImageLoader, decode_image
+from core.pyramid import ImagePyramid
+
+
+def decoded_size(image, pyramid):
+    """Return the memory held by a decoded image and its display pyramid"""
+    size = image.sizeInBytes() if isinstance(image, QImage) else 0
+    return size + (pyramid.size_in_bytes() if pyramid else 0)
+
+
+class _PrefetchSignals(QObject):
+    ready = Signal(str, object, object)
+    failed = Signal(str)
+
+
+class _PrefetchTask(QRunnable):
+    """Decode a neighbouring image and build its pyramid ahead of time"""
+
+    def __init__(self, path, signals):
+        super().__init__()
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        try:
+            image = decode_image(self.path)
+            pyramid = ImagePyramid.for_source(image)
+        except Exception:
+            self.signals.failed.emit(self.path)
+        else:
+            self.signals.ready.emit(self.path, image, pyramid)
+
+
+class ImageSession(QObject):
+    """Images opened together, the most recently used ones are kept decoded
+
+    At most max_images decoded images (plus their display pyramids) are kept,
+    and never more than memory_limit bytes. The neighbours of the current
+    image are decoded in the background so stepping through a shoot is
+    near-instant.
+    """
+
+    current_changed = Signal(int)
+    loading_started = Signal(str)
+    preview_ready = Signal(QImage)
+    image_ready = Signal(object, object)
+    failed = Signal(str)
+
+    def __init__(self, parent=None, max_images=5, memory_limit=2048 * 1024 * 1024):
+        super().__init__(parent)
+        self.paths = []
+        self.index = -1
+        self.max_images = max(1, max_images)
+        self.memory_limit = memory_limit
+        self.cache = OrderedDict()
+
+        self.loader = ImageLoader(self)
+        self.loader.preview_ready.connect(self.preview_ready)
+        self.loader.image_ready.connect(self._on_loaded)
+        self.loader.failed.connect(self.failed)
+
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(1)
+        self._prefetching = set()
+        self._prefetch_signals = _PrefetchSignals(self)
+        self._prefetch_signals.ready.connect(self._on_prefetched)
+        self._prefetch_signals.failed.connect(self._on_prefetch_failed)
+
+    def open(self, paths, show_first=True):
+        """Replace the session with a new set of files and optionally show the first"""
+        # A load still running belongs to the previous files
+        self.loader.cancel()
+        self.paths = list(paths)
+        self.index = -1
+        self.cache.clear()
+        if self.paths and show_first:
+            self.select(0)
+
+    def current_path(self):
+        if 0 <= self.index < len(self.paths):
+            return self.paths[self.index]
+        return None
+
+    def select(self, index):
+        """Show the image at index, from the cache when it is still decoded"""
+        if not 0 <= index < len(self.paths) or index == self.index:
+            return
+        self.index = index
+        path = self.paths[index]
+        self.current_changed.emit(index)
+
+        if path in self.cache:
+            self.loader.cancel()
+            self.cache.move_to_end(path)
+            self.image_ready.emit(*self.cache[path])
+        elif path not in self._prefetching:
+            self.loading_started.emit(path)
+            self.loader.load(path)
+        else:
+            # Already decoding in the background, _on_prefetched will show it
+            self.loader.cancel()
+            self.loading_started.emit(path)
+        self._prefetch_neighbours()
+
+    def next(self):
+        self.select(self.index + 1)
+
+    def previous(self):
+        self.select(self.index - 1)
+
+    def _prefetch_neighbours(self):
+        for index in (self.index + 1, self.index - 1):
+            if not 0 <= index < len(self.paths):
+                continue
+            path = self.paths[index]
+            if path in self.cache or path in self._prefetching:
+                continue
+            self._prefetching.add(path)
+            self.prefetch_pool.start(_PrefetchTask(path, self._prefetch_signals))
+
+    def _store(self, path, image, pyramid):
+        self.cache[path] = (image, pyramid)
+        self.cache.move_to_end(path)
+        current = self.current_path()
+        while len(self.cache) > 1:
+            total = sum(decoded_size(*entry) for entry in self.cache.values())
+            if len(self.cache) <= self.max_images and total <= self.memory_limit:
+                break
+            oldest = next(key for key in self.cache if key != current)
+            del self.cache[oldest]
+
+    def _on_loaded(self, image, pyramid):
+        path = self.current_path()
+        self._store(path, image, pyramid)
+        self.image_ready.emit(image, pyramid)
+
+    def _on_prefetched(self, path, image, pyramid):
+        self._prefetching.discard(path)
+        if path not in self.paths:
+            return
+        if path == self.current_path():
+            self._store(path, image, pyramid)
+            self.image_ready.emit(image, pyramid)
+            return
+        # Only keep neighbours that are still next to the current image
+        if abs(self.paths.index(path) - self.index) <= 1:
+            self._store(path, image, pyramid)
+
+    def _on_prefetch_failed(self, path):
+        self._prefetching.discard(path)
+        if path == self.current_path():
+            # The image was selected while it was prefetched, load it the
+            # normal way so the error (or a late success) reaches the UI
+            self.loader.load(path)
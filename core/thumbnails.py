@@ -0,0 +1,198 @@
+"""Background thumbnail generation with a persistent SQLite store"""
+import os
+import sqlite3
+import threading
+
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QImage
+
+from core.image_loader import image_reader
+from core.tiled_image import open_tiled
+
+
+THUMBNAIL_SIZE = 160
+
+# compact() only runs VACUUM once more than this share of the database is free pages
+VACUUM_FREE_RATIO = 0.25
+
+
+def render_thumbnail(path, size=THUMBNAIL_SIZE):
+    """Decode a thumbnail, letting the codec downscale while decoding where it can"""
+    tiled = open_tiled(path)
+    if tiled:
+        image = tiled.proxy(size * 2)
+        tiled.close()
+    else:
+        reader = image_reader(path)
+        source_size = reader.size()
+        if source_size.isValid():
+            reader.setScaledSize(source_size.scaled(size * 2, size * 2, Qt.KeepAspectRatio))
+        image = reader.read()
+    if image.isNull():
+        return image
+    return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+class ThumbnailStore:
+    """Thumbnails in a SQLite database keyed by path, mtime and size
+
+    A row whose mtime or size no longer matches the file is treated as
+    missing and replaced, so changed files are re-rendered one by one.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between the worker threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, path):
+        """Return the stored thumbnail, or None if it is missing or stale"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        row = self._connection().execute(
+            "SELECT mtime_ns, size, data FROM thumbnails WHERE path = ?",
+            (os.path.abspath(path),),
+        ).fetchone()
+        if not row:
+            return None
+        if row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            self.invalidate(path)
+            return None
+        image = QImage.fromData(row[2])
+        return None if image.isNull() else image
+
+    def put(self, path, image):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "JPEG", 85)
+        buffer.close()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, data.data()),
+            )
+
+    def invalidate(self, path):
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM thumbnails WHERE path = ?", (os.path.abspath(path),)
+            )
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM thumbnails").fetchone()[0]
+
+    def compact(self):
+        """Drop thumbnails of deleted or changed files and reclaim the space"""
+        connection = self._connection()
+        stale = []
+        for path, mtime_ns, size in connection.execute(
+            "SELECT path, mtime_ns, size FROM thumbnails"
+        ).fetchall():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stale.append((path,))
+                continue
+            if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                stale.append((path,))
+        if not stale:
+            return 0
+        with connection:
+            connection.executemany("DELETE FROM thumbnails WHERE path = ?", stale)
+        # VACUUM rewrites the whole file, only pay for it once enough space is free
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = connection.execute("PRAGMA page_count").fetchone()[0]
+        if free_pages > total_pages * VACUUM_FREE_RATIO:
+            connection.execute("VACUUM")
+        return len(stale)
+
+
+class _CompactTask(QRunnable):
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def run(self):
+        self.store.compact()
+
+
+class _ThumbnailSignals(QObject):
+    thumbnail_ready = Signal(str, QImage)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, path, store, signals):
+        super().__init__()
+        self.path = path
+        self.store = store
+        self.signals = signals
+
+    def run(self):
+        image = self.store.get(self.path)
+        if image is None:
+            image = render_thumbnail(self.path)
+            if not image.isNull():
+                self.store.put(self.path, image)
+        self.signals.thumbnail_ready.emit(self.path, image)
+
+
+class ThumbnailLoader(QObject):
+    """Load thumbnails from the store or render them on worker threads"""
+
+    thumbnail_ready = Signal(str, QImage)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        # Separate from the thumbnail jobs so clear() can never drop a compaction
+        self._compact_pool = QThreadPool(self)
+        self._compact_pool.setMaxThreadCount(1)
+        self._requested = set()
+
+        self._signals = _ThumbnailSignals(self)
+        self._signals.thumbnail_ready.connect(self._on_ready)
+
+    def request(self, path):
+        """Queue a thumbnail unless it is already on its way"""
+        if path in self._requested:
+            return
+        self._requested.add(path)
+        self.pool.start(_ThumbnailTask(path, self.store, self._signals))
+
+    def compact(self):
+        """Compact the store on a worker thread"""
+        self._compact_pool.start(_CompactTask(self.store))
+
+    def clear(self):
+        """Drop queued requests, e.g. when a different set of files is opened"""
+        self.pool.clear()
+        self._requested.clear()
+
+    def _on_ready(self, path, image):
+        self._requested.discard(path)
+        self.thumbnail_ready.emit(path, image)
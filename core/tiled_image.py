@@ -0,0 +1,239 @@
+"""Memory-mapped, tiled access to very large TIFF images"""
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from PySide6.QtCore import QRect
+from PySide6.QtGui import QImage, QImageReader
+
+
+# Sources above this size are opened tiled instead of being decoded in full
+TILED_MIN_PIXELS = 200_000_000
+
+# Qt refuses to decode images above 256 MB by default, sources too large
+# even for this limit should be uncompressed or deflate TIFFs opened tiled
+ALLOCATION_LIMIT_MB = 2048
+
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+_COMPRESSION_NONE = 1
+_COMPRESSION_DEFLATE = (8, 32946)
+
+_TAG_TYPES = {
+    1: ("B", 1),  # BYTE
+    3: ("H", 2),  # SHORT
+    4: ("I", 4),  # LONG
+    16: ("Q", 8),  # LONG8 (BigTIFF)
+}
+
+_FORMATS = {
+    1: QImage.Format_Grayscale8,
+    3: QImage.Format_RGB888,
+    4: QImage.Format_RGBA8888,
+}
+
+
+class TiledImage:
+    """Uncompressed or deflate TIFF (strips or tiles) read through mmap
+
+    Only the strips/tiles touched by a requested region are read, and
+    deflate tiles are decoded on demand into a small LRU cache, so memory
+    use is bounded by the region size rather than the source size.
+    """
+
+    def __init__(self, path, cache_bytes=64 * 1024 * 1024):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty file: {path}")
+        if hasattr(mmap, "MADV_RANDOM"):
+            # Regions are sparse, kernel read-ahead would page in far more than needed
+            self._map.madvise(mmap.MADV_RANDOM)
+        self._cache = OrderedDict()
+        self._cache_bytes = cache_bytes
+        self._cached_bytes = 0
+        self._cache_lock = threading.Lock()
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _parse(self):
+        data = self._map
+        order = {b"II": "<", b"MM": ">"}.get(bytes(data[:2]))
+        if not order:
+            raise ValueError(f"Not a TIFF file: {self.path}")
+        magic = struct.unpack_from(order + "H", data, 2)[0]
+        if magic == 42:
+            offset = struct.unpack_from(order + "I", data, 4)[0]
+            count_format, entry_format, entry_size = "H", "HHI4s", 12
+        elif magic == 43:
+            offset = struct.unpack_from(order + "Q", data, 8)[0]
+            count_format, entry_format, entry_size = "Q", "HHQ8s", 20
+        else:
+            raise ValueError(f"Not a TIFF file: {self.path}")
+
+        count = struct.unpack_from(order + count_format, data, offset)[0]
+        offset += struct.calcsize(count_format)
+        tags = {}
+        for i in range(count):
+            tag, kind, n, inline = struct.unpack_from(
+                order + entry_format, data, offset + i * entry_size
+            )
+            if kind not in _TAG_TYPES:
+                continue
+            code, size = _TAG_TYPES[kind]
+            if n * size <= len(inline):
+                raw, start = inline, 0
+            else:
+                raw = data
+                start = struct.unpack_from(order + ("I" if magic == 42 else "Q"), inline)[0]
+            tags[tag] = struct.unpack_from(f"{order}{n}{code}", raw, start)
+
+        def value(tag, default=None):
+            return tags[tag][0] if tag in tags else default
+
+        self._width = value(256)
+        self._height = value(257)
+        self.samples = value(277, 1)
+        bits = tags.get(258, (8,))
+        self.compression = value(259, _COMPRESSION_NONE)
+        photometric = value(262)
+
+        if not self._width or not self._height:
+            raise ValueError("TIFF has no image dimensions")
+        if any(b != 8 for b in bits) or self.samples not in _FORMATS:
+            raise ValueError("Only 8-bit grayscale, RGB and RGBA TIFFs can be tiled")
+        if photometric not in (1, 2) or value(284, 1) != 1 or value(317, 1) != 1:
+            raise ValueError("Unsupported TIFF photometric, planar or predictor setting")
+        if self.compression != _COMPRESSION_NONE and self.compression not in _COMPRESSION_DEFLATE:
+            raise ValueError("Only uncompressed and deflate TIFFs can be tiled")
+
+        if 322 in tags:
+            self.chunk_width = value(322)
+            self.chunk_height = value(323)
+            self.offsets, self.byte_counts = tags[324], tags[325]
+        else:
+            self.chunk_width = self._width
+            self.chunk_height = min(value(278, self._height), self._height)
+            self.offsets, self.byte_counts = tags[273], tags[279]
+        self.chunks_across = -(-self._width // self.chunk_width)
+        self.format = _FORMATS[self.samples]
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def rect(self):
+        return QRect(0, 0, self._width, self._height)
+
+    def isNull(self):
+        return False
+
+    def _chunk(self, index):
+        """Return the pixel bytes of one strip or tile"""
+        start = self.offsets[index]
+        end = start + self.byte_counts[index]
+        if self.compression == _COMPRESSION_NONE:
+            return memoryview(self._map)[start:end]
+
+        # Export, preview and tile workers read the same image concurrently
+        with self._cache_lock:
+            chunk = self._cache.get(index)
+            if chunk is not None:
+                self._cache.move_to_end(index)
+                return chunk
+        chunk = zlib.decompress(self._map[start:end])
+        with self._cache_lock:
+            if index not in self._cache:
+                self._cache[index] = chunk
+                self._cached_bytes += len(chunk)
+                while self._cached_bytes > self._cache_bytes and len(self._cache) > 1:
+                    self._cached_bytes -= len(self._cache.popitem(last=False)[1])
+        return chunk
+
+    def _row(self, y, x0, x1):
+        """Return the pixel bytes of row y between columns x0 and x1"""
+        samples = self.samples
+        row_bytes = self.chunk_width * samples
+        chunk_row = y // self.chunk_height
+        offset = (y % self.chunk_height) * row_bytes
+        parts = []
+        for column in range(x0 // self.chunk_width, (x1 - 1) // self.chunk_width + 1):
+            left = column * self.chunk_width
+            start = max(x0, left) - left
+            end = min(x1, left + self.chunk_width) - left
+            chunk = self._chunk(chunk_row * self.chunks_across + column)
+            parts.append(chunk[offset + start * samples:offset + end * samples])
+        return b"".join(parts)
+
+    def region(self, rect, max_width=None, max_height=None):
+        """Decode rect into a QImage, subsampled to fit max_width x max_height if given"""
+        rect = QRect(rect).intersected(self.rect())
+        step = 1
+        if max_width and max_height:
+            step = max(1, -(-rect.width() // max_width), -(-rect.height() // max_height))
+
+        samples = self.samples
+        x0, x1 = rect.x(), rect.x() + rect.width()
+        out_width = -(-rect.width() // step)
+        out_height = -(-rect.height() // step)
+        image = QImage(out_width, out_height, self.format)
+        bits = image.bits()
+        bytes_per_line = image.bytesPerLine()
+        line_bytes = out_width * samples
+
+        for out_y, y in enumerate(range(rect.y(), rect.y() + rect.height(), step)):
+            row = self._row(y, x0, x1)
+            if step > 1:
+                # Nearest neighbour subsampling, one strided slice per channel
+                sampled = bytearray(line_bytes)
+                for channel in range(samples):
+                    sampled[channel::samples] = row[channel::samples * step]
+                row = sampled
+            start = out_y * bytes_per_line
+            bits[start:start + line_bytes] = row
+        return image
+
+    def copy(self, rect):
+        return self.region(rect)
+
+    def proxy(self, max_size):
+        """Return a subsampled overview of the whole image"""
+        return self.region(self.rect(), max_size, max_size)
+
+
+def open_tiled(path, min_pixels=TILED_MIN_PIXELS):
+    """Open path as a TiledImage if it is a supported TIFF of at least min_pixels"""
+    if not path.lower().endswith(TIFF_EXTENSIONS):
+        return None
+    try:
+        image = TiledImage(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if image.width() * image.height() < min_pixels:
+        image.close()
+        return None
+    return image
+
+
+def open_source(path, min_pixels=TILED_MIN_PIXELS):
+    """Open large TIFFs as a TiledImage and decode everything else into a QImage"""
+    tiled = open_tiled(path, min_pixels)
+    if tiled:
+        return tiled
+    # Batch and watch workers never create an ImageLoader, raise the limit here too
+    QImageReader.setAllocationLimit(ALLOCATION_LIMIT_MB)
+    return QImage(path)
@@ -0,0 +1,207 @@
+"""Tiled rendering of a crop at any zoom, with an LRU cache of finished tiles
+
+A zoomed crop is cut into TILE_SIZE squares in its rotated, scaled
+coordinates. Tiles are rendered on worker threads from the pyramid level
+matching the zoom, so only the visible part of a huge crop is ever read.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QRect, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage
+
+from core import instrumentation
+from core.crop_engine import rotated_size, source_rect, transpose
+from core.crop_view import render_region
+
+
+TILE_SIZE = 256
+
+# Largest zoom, 800%
+MAX_SCALE = 8.0
+
+
+def zoom_scales(fit, max_scale=MAX_SCALE):
+    """Return the zoom steps: fit, then every power of two above it up to max_scale"""
+    scales = [fit]
+    scale = 1 / 64
+    while scale <= max_scale:
+        # Skip a step that would barely differ from fit
+        if scale > fit * 1.25:
+            scales.append(scale)
+        scale *= 2
+    return scales
+
+
+def scaled_size(view, scale):
+    """Return the (width, height) of a CropView as rotated and scaled"""
+    width, height = view.size()
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def tile_grid(view, scale, tile_size=TILE_SIZE):
+    """Return the (columns, rows) of tiles covering a CropView at scale"""
+    width, height = scaled_size(view, scale)
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+
+def render_tile(view, pyramid, scale, column, row, tile_size=TILE_SIZE):
+    """Render one tile of a CropView at scale, edge tiles are cut to the crop"""
+    width, height = view.size()
+    tile = QRect(column * tile_size, row * tile_size, tile_size, tile_size).intersected(
+        QRect(0, 0, *scaled_size(view, scale))
+    )
+    left = math.floor(tile.x() / scale)
+    top = math.floor(tile.y() / scale)
+    right = min(width, math.ceil((tile.x() + tile.width()) / scale))
+    bottom = min(height, math.ceil((tile.y() + tile.height()) / scale))
+    # Map the tile through the rotation onto the unrotated source
+    rect = source_rect(
+        QRect(left, top, max(1, right - left), max(1, bottom - top)),
+        view.rotation,
+        view.rect.width(),
+        view.rect.height(),
+    ).translated(view.rect.topLeft())
+    tile_width, tile_height = rotated_size(tile.width(), tile.height(), view.rotation)
+    return transpose(
+        render_region(view.source, pyramid, rect, tile_width, tile_height), view.rotation
+    )
+
+
+class TileCache:
+    """Rendered tiles keyed by (scale, column, row), least recently used evicted first"""
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.size_in_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.tiles
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        """Store a QImage or QPixmap tile, evicting the oldest tiles over the budget"""
+        if key in self.tiles:
+            self.size_in_bytes -= self._size(self.tiles.pop(key))
+        self.tiles[key] = tile
+        self.size_in_bytes += self._size(tile)
+        while self.size_in_bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.size_in_bytes -= self._size(evicted)
+
+    def clear(self):
+        self.tiles.clear()
+        self.size_in_bytes = 0
+
+    @staticmethod
+    def _size(tile):
+        return tile.width() * tile.height() * 4
+
+
+class _TileSignals(QObject):
+    tile_ready = Signal(int, object, QImage)
+    tile_failed = Signal(int, object)
+
+
+class _TileTask(QRunnable):
+    def __init__(self, generation, key, view, pyramid, claim, signals):
+        super().__init__()
+        self.generation = generation
+        self.key = key
+        self.view = view
+        self.pyramid = pyramid
+        self.claim = claim
+        self.signals = signals
+
+    def run(self):
+        if not self.claim(self.generation, self.key):
+            return
+        scale, column, row = self.key
+        try:
+            with instrumentation.span("tile.render"):
+                image = render_tile(self.view, self.pyramid, scale, column, row)
+        except Exception:
+            self.signals.tile_failed.emit(self.generation, self.key)
+        else:
+            self.signals.tile_ready.emit(self.generation, self.key, image)
+
+
+class TileRenderer(QObject):
+    """Render the tiles of one CropView on worker threads
+
+    Each tile is queued at most once. retain() drops queued tiles that
+    scrolled out of view before a worker picked them up, and set_source()
+    discards everything that belongs to the previous crop. Dropped tasks
+    stay in the pool but return as soon as a worker runs them.
+    """
+
+    tile_ready = Signal(object, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self.view = None
+        self.pyramid = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._running = set()
+        self._signals = _TileSignals(self)
+        self._signals.tile_ready.connect(self._on_tile_ready)
+        self._signals.tile_failed.connect(self._on_tile_failed)
+
+    def set_source(self, view, pyramid):
+        """Render tiles of a CropView from now on"""
+        with self._lock:
+            self._generation += 1
+            self._queued.clear()
+            self._running.clear()
+        self.view = view
+        self.pyramid = pyramid
+
+    def request(self, key):
+        """Queue the (scale, column, row) tile unless it is already queued"""
+        if self.view is None:
+            return
+        with self._lock:
+            if key in self._queued or key in self._running:
+                return
+            self._queued.add(key)
+        self.pool.start(
+            _TileTask(self._generation, key, self.view, self.pyramid, self._claim, self._signals)
+        )
+
+    def retain(self, keys):
+        """Drop the queued tiles not in keys, tiles already rendering are kept"""
+        with self._lock:
+            self._queued.intersection_update(keys)
+
+    def _claim(self, generation, key):
+        """Called by a worker before rendering, False if the tile was dropped"""
+        with self._lock:
+            if generation != self._generation or key not in self._queued:
+                return False
+            self._queued.discard(key)
+            self._running.add(key)
+            return True
+
+    def _on_tile_ready(self, generation, key, image):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._running.discard(key)
+        self.tile_ready.emit(key, image)
+
+    def _on_tile_failed(self, generation, key):
+        # The tile is requested again the next time it is painted
+        with self._lock:
+            if generation == self._generation:
+                self._running.discard(key)
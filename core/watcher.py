@@ -0,0 +1,363 @@
+"""Watch a hot folder and crop every image that lands in it
+
+Usage:
+    python -m core.watcher inbox/
+    python -m core.watcher inbox/ -r 1920x1080 -a auto --queue-size 16
+    python -m core.watcher inbox/ --fanout 720p,1080p,1440p --poll
+
+Files are picked up once they are complete: on Linux through inotify
+(closed after writing, or moved in), elsewhere by polling until their size
+and modification time stop changing. At most --queue-size files are queued
+or in progress, and the watcher stops taking new files until one finishes.
+Every processed file is appended to a journal in the output directory, so
+a restarted watcher never crops the same version of a file twice.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from core.crop_engine import (
+    ANCHORS, AUTO_ANCHOR, IMAGE_EXTENSIONS, SUBJECT_ANCHOR, crop_file, parse_resolution
+)
+from core.fanout import DEFAULT_TEMPLATE, fanout_file, parse_sizes
+
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "output")
+
+JOURNAL_NAME = ".watch_journal.jsonl"
+
+# A polled file counts as complete once it has not changed for this long
+SETTLE_SECONDS = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(path).startswith(".")
+
+
+def file_key(path):
+    """Identify a version of a file by path, mtime and size, None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+class Journal:
+    """Append-only record of the file versions that were already processed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash, the file is simply processed again
+                        continue
+                    self.done.add((entry["path"], entry["mtime_ns"], entry["size"]))
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def record(self, key, output=None, error=None):
+        path, mtime_ns, size = key
+        line = json.dumps(
+            {"path": path, "mtime_ns": mtime_ns, "size": size, "output": output, "error": error}
+        )
+        with self._lock:
+            self.done.add(key)
+            with open(self.path, "a") as file:
+                file.write(line + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+
+class InotifySource:
+    """Yield the paths of files closed after writing or moved into a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+
+    def poll(self, timeout):
+        """Return the completed paths seen within timeout, None after an overflow"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped by the kernel, the caller rescans the folder
+                return None
+            if name:
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Yield files whose size and mtime stopped changing, for platforms without inotify"""
+
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self.seen = {}
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        now = time.time()
+        current = {}
+        paths = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                version = (stat.st_mtime_ns, stat.st_size)
+                current[entry.path] = version
+                settled = now - stat.st_mtime >= SETTLE_SECONDS
+                if self.seen.get(entry.path) == version and settled:
+                    paths.append(entry.path)
+        self.seen = current
+        return paths
+
+    def close(self):
+        pass
+
+
+def _watch_job(job):
+    path, width, height, anchor, output_dir, sizes, template = job
+    try:
+        if sizes:
+            return fanout_file(path, sizes, anchor, output_dir, template), None
+        return crop_file(path, width, height, anchor, output_dir), None
+    except Exception as e:
+        return None, str(e)
+
+
+class HotFolder:
+    """Crop the images arriving in a directory with a bounded process pool"""
+
+    def __init__(self, directory, width=None, height=None, anchor="center",
+                 output_dir=DEFAULT_OUTPUT_DIR, sizes=None, template=DEFAULT_TEMPLATE,
+                 workers=None, queue_size=32, use_inotify=True, poll_interval=1.0):
+        self.directory = os.path.abspath(directory)
+        self.width = width
+        self.height = height
+        self.anchor = anchor
+        self.output_dir = output_dir
+        self.sizes = sizes
+        self.template = template
+        self.workers = workers or os.cpu_count() or 1
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.poll_interval = poll_interval
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.journal = Journal(os.path.join(output_dir, JOURNAL_NAME))
+        # Bounds the files queued in or running on the pool, acquiring blocks when full
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.in_flight = set()
+        # Files seen at startup that were still too fresh, rechecked until they settle
+        self.pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def open_source(self):
+        if self.use_inotify:
+            try:
+                return InotifySource(self.directory)
+            except OSError as e:
+                print(f"inotify unavailable ({e}), polling instead", file=sys.stderr)
+        return PollingSource(self.directory, self.poll_interval)
+
+    def existing_files(self):
+        """Files already in the folder that are old enough to be complete
+
+        Younger images go to pending instead: inotify reports nothing for a
+        write that finished before the watch started, so settled_files()
+        picks them up once they stop changing.
+        """
+        now = time.time()
+        paths = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if now - entry.stat().st_mtime >= SETTLE_SECONDS:
+                    paths.append(entry.path)
+                elif is_image(entry.path):
+                    self.pending.add(entry.path)
+        return sorted(paths)
+
+    def settled_files(self):
+        """Pending files that have not changed for SETTLE_SECONDS"""
+        now = time.time()
+        paths = []
+        for path in sorted(self.pending):
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self.pending.discard(path)
+                continue
+            if now - mtime >= SETTLE_SECONDS:
+                self.pending.discard(path)
+                paths.append(path)
+        return paths
+
+    def submit(self, executor, path):
+        """Queue a file unless it is not an image, in progress or in the journal"""
+        if not is_image(path):
+            return
+        key = file_key(path)
+        if key is None or key in self.journal:
+            return
+        with self._lock:
+            if key in self.in_flight:
+                return
+            self.in_flight.add(key)
+
+        # Backpressure: wait here, without reading new events, while the queue is full
+        while not self.slots.acquire(timeout=0.5):
+            if self._stop.is_set():
+                with self._lock:
+                    self.in_flight.discard(key)
+                return
+
+        job = (path, self.width, self.height, self.anchor, self.output_dir, self.sizes, self.template)
+        future = executor.submit(_watch_job, job)
+        future.add_done_callback(lambda done, key=key: self._on_done(key, done))
+
+    def _on_done(self, key, future):
+        try:
+            output, error = future.result()
+        except Exception as e:
+            # The pool itself failed (e.g. on Ctrl+C), leave the file for the next run
+            with self._lock:
+                self.in_flight.discard(key)
+            self.slots.release()
+            print(f"Interrupted: {key[0]}: {e}", file=sys.stderr)
+            return
+        self.journal.record(key, output, error)
+        with self._lock:
+            self.in_flight.discard(key)
+            if error:
+                self.failed += 1
+            else:
+                self.processed += 1
+        self.slots.release()
+        if error:
+            print(f"Failed: {key[0]}: {error}", file=sys.stderr)
+        else:
+            print(f"Cropped {os.path.basename(key[0])}")
+
+    def run(self):
+        """Process the folder until stop() is called"""
+        source = self.open_source()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for path in self.existing_files():
+                    self.submit(executor, path)
+                while not self._stop.is_set():
+                    paths = source.poll(0.5)
+                    if paths is None:
+                        paths = self.existing_files()
+                    for path in paths + self.settled_files():
+                        if self._stop.is_set():
+                            break
+                        self.submit(executor, path)
+            finally:
+                source.close()
+
+
+def load_watch_config():
+    """Read the default watch policy from config.json"""
+    try:
+        with open("config.json", "r") as file:
+            config = json.load(file)
+    except (OSError, ValueError):
+        config = {}
+    return {
+        "resolution": config.get("watch_resolution", "1920x1080"),
+        "anchor": config.get("watch_anchor", "center"),
+        "queue_size": int(config.get("watch_queue_size", 32)),
+    }
+
+
+def main(argv=None):
+    config = load_watch_config()
+    parser = argparse.ArgumentParser(description="Crop images as they land in a hot folder")
+    parser.add_argument("directory", help="folder to watch")
+    parser.add_argument("-r", "--resolution", default=config["resolution"], help="target resolution, e.g. 1920x1080")
+    parser.add_argument("--fanout", default=None, help="comma separated sizes, e.g. 720p,1080p,1440p")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="fan-out file name template")
+    parser.add_argument("-a", "--anchor", default=config["anchor"],
+                        choices=ANCHORS + (AUTO_ANCHOR, SUBJECT_ANCHOR), help="where to place the crop")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_DIR, help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: core count)")
+    parser.add_argument("--queue-size", type=int, default=config["queue_size"],
+                        help="files queued or in progress before the watcher waits")
+    parser.add_argument("--poll", action="store_true", help="poll instead of using inotify")
+    args = parser.parse_args(argv)
+
+    width = height = sizes = None
+    try:
+        if args.fanout:
+            sizes = parse_sizes(args.fanout.split(","))
+        else:
+            width, height = parse_resolution(args.resolution)
+    except ValueError:
+        parser.error("resolution must be in format: widthxheight (e.g. 1920x1080)")
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+
+    folder = HotFolder(
+        args.directory, width, height, args.anchor, args.output, sizes, args.template,
+        args.workers, max(1, args.queue_size), use_inotify=not args.poll,
+    )
+    print(f"Watching {folder.directory}, press Ctrl+C to stop")
+    try:
+        folder.run()
+    except KeyboardInterrupt:
+        folder.stop()
+    print(f"Cropped {folder.processed} images, {folder.failed} failed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""On-disk content-addressed cache for downloaded images"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+class WebImageCache:
+    """Cache keyed by URL, storing each distinct body once under its SHA-256
+
+    Entries younger than max_age are served without touching the network,
+    older ones are revalidated with their ETag/Last-Modified validators.
+    The least recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        self.entries = index.get("entries", {})
+        self.hits = index.get("hits", 0)
+        self.misses = index.get("misses", 0)
+
+    def _save_index(self):
+        index = {"entries": self.entries, "hits": self.hits, "misses": self.misses}
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read_blob(self, url):
+        entry = self.entries.get(url)
+        if not entry:
+            return None
+        try:
+            with open(self._blob_path(entry["hash"]), "rb") as f:
+                return f.read()
+        except OSError:
+            del self.entries[url]
+            return None
+
+    def _blob_sizes(self):
+        return {entry["hash"]: entry["size"] for entry in self.entries.values()}
+
+    def get(self, url):
+        """Return the cached body if it is fresh enough to skip the network"""
+        with self._lock:
+            entry = self.entries.get(url)
+            if not entry or time.time() - entry["fetched"] > self.max_age:
+                return None
+            data = self._read_blob(url)
+            if data is None:
+                return None
+            entry["last_used"] = time.time()
+            self.hits += 1
+            self._save_index()
+            return data
+
+    def conditional_headers(self, url):
+        """Return the revalidation headers for a stale entry"""
+        with self._lock:
+            entry = self.entries.get(url, {})
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def revalidate(self, url, headers):
+        """Refresh a stale entry after a 304 response and return its body"""
+        with self._lock:
+            data = self._read_blob(url)
+            if data is None:
+                return None
+            entry = self.entries[url]
+            entry["fetched"] = entry["last_used"] = time.time()
+            entry["etag"] = headers.get("ETag", entry.get("etag"))
+            entry["last_modified"] = headers.get("Last-Modified", entry.get("last_modified"))
+            self.hits += 1
+            self._save_index()
+            return data
+
+    def store(self, url, data, headers):
+        """Add a freshly downloaded body to the cache"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+            now = time.time()
+            self.entries[url] = {
+                "hash": digest,
+                "size": len(data),
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched": now,
+                "last_used": now,
+            }
+            self.misses += 1
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        sizes = self._blob_sizes()
+        total = sum(sizes.values())
+        by_age = sorted(self.entries, key=lambda url: self.entries[url]["last_used"])
+        while by_age and total > self.max_bytes:
+            digest = self.entries.pop(by_age.pop(0))["hash"]
+            if all(entry["hash"] != digest for entry in self.entries.values()):
+                total -= sizes[digest]
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+
+    def size(self):
+        """Return the number of bytes stored on disk"""
+        with self._lock:
+            return sum(self._blob_sizes().values())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+        }
@@ -0,0 +1,159 @@
+"""Downloads against a local HTTP server standing in for image hosts
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QBuffer, QByteArray, QCoreApplication, QIODevice
+from PySide6.QtGui import QColor, QImage
+
+from core.downloader import CHUNK_SIZE, DownloadError, ImageDownloader, create_session, fetch
+
+
+def png_bytes(width=64, height=48):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor(200, 40, 40))
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(data)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    image = png_bytes()
+    large = b"\0" * (CHUNK_SIZE * 4)
+    release = threading.Event()
+
+    def do_GET(self):
+        if self.path == "/image.png":
+            self._send(self.image)
+        elif self.path == "/large":
+            self._send(self.large)
+        elif self.path == "/large-no-length":
+            self._send(self.large, length=False)
+        elif self.path == "/slow.png":
+            # Hold the body back until the test lets it through
+            self.release.wait(5)
+            self._send(self.image)
+        else:
+            self.send_error(404)
+
+    def _send(self, body, length=True):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        if length:
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(body), CHUNK_SIZE):
+            self.wfile.write(body[start:start + CHUNK_SIZE])
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading at the size cap or on cancel are expected
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+        cls.server = _Server(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        _Handler.release.set()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.session = create_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.01)
+        self.app.processEvents()
+
+    def test_fetch_reports_progress(self):
+        updates = []
+        data = fetch(self.session, self.base + "/large", progress=lambda *update: updates.append(update))
+        self.assertEqual(len(data), len(_Handler.large))
+        self.assertEqual(updates[-1], (len(_Handler.large), len(_Handler.large)))
+        self.assertEqual([received for received, _ in updates], sorted(received for received, _ in updates))
+
+    def test_fetch_rejects_declared_size_over_cap(self):
+        with self.assertRaisesRegex(DownloadError, "too large"):
+            fetch(self.session, self.base + "/large", max_bytes=CHUNK_SIZE)
+
+    def test_fetch_stops_streaming_at_cap(self):
+        with self.assertRaisesRegex(DownloadError, "limit"):
+            fetch(self.session, self.base + "/large-no-length", max_bytes=CHUNK_SIZE)
+
+    def test_fetch_honours_cancel(self):
+        cancelled = threading.Event()
+        cancelled.set()
+        with self.assertRaisesRegex(DownloadError, "cancelled"):
+            fetch(self.session, self.base + "/large", cancelled=cancelled)
+
+    def test_downloader_decodes_image(self):
+        downloader = ImageDownloader(session=self.session)
+        results = []
+        downloader.finished.connect(lambda url, image: results.append(image.size()))
+        downloader.failed.connect(lambda url, message: results.append(message))
+        downloader.download(self.base + "/image.png")
+        self.wait_for(lambda: results)
+        self.assertEqual(len(results), 1)
+        self.assertEqual((results[0].width(), results[0].height()), (64, 48))
+
+    def test_downloader_cancel_while_streaming(self):
+        _Handler.release.clear()
+        downloader = ImageDownloader(session=self.session)
+        results = []
+        downloader.finished.connect(lambda *args: results.append("finished"))
+        downloader.failed.connect(lambda *args: results.append("failed"))
+        downloader.download(self.base + "/slow.png")
+        time.sleep(0.2)
+        downloader.cancel()
+        _Handler.release.set()
+        downloader.pool.waitForDone(5000)
+        self.wait_for(lambda: False, timeout=0.3)
+        self.assertEqual(results, [])
+
+    def test_downloader_cancel_after_download_completed(self):
+        # The download is done but its result has not reached the GUI thread yet
+        downloader = ImageDownloader(session=self.session)
+        results = []
+        downloader.finished.connect(lambda *args: results.append("finished"))
+        downloader.failed.connect(lambda *args: results.append("failed"))
+        downloader.download(self.base + "/image.png")
+        downloader.pool.waitForDone(5000)
+        downloader.cancel()
+        self.wait_for(lambda: False, timeout=0.3)
+        self.assertEqual(results, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,7 +15,7 @@ from PySide6.QtWidgets import (
     QFrame,
 )
 from PySide6.QtCore import Qt, QPoint, QSize
-from PySide6.QtGui import QPixmap, QTransform, QKeySequence, QIcon, QFont
+from PySide6.QtGui import QPixmap, QTransform, QKeySequence, QIcon, QFont, QShortcut
 
 from widget.canvas import Canvas
 from widget.preview_dialog import PreviewDialog
@@ -23,11 +23,27 @@ from widget.ToolTips import ToolTipsButton
 from widget.styles import Styles
 from widget.message_box import StyleMessageBox
 from widget.web_import_dialog import WebImportDialog
+from widget.thumbnail_strip import ThumbnailStrip
+from core.crop_engine import aspect_size, collect_images, parse_resolution
+from core.session import ImageSession
+from core.thumbnails import ThumbnailLoader, ThumbnailStore
+from core.export_queue import EXPORT_FORMATS, ExportQueue, ExportSettings
+from core.recipes import CropRecipe, RecipeReplayer
+from core.fanout import fanout_name, parse_sizes
+from core.preview import PreviewRenderer
+from core import instrumentation
 
 import time
 import json
 
 
+# Export modes that crop by aspect ratio and resample to the target resolution
+RESAMPLE_MODES = {
+    "Resampled (Lanczos)": "lanczos",
+    "Resampled (Area)": "area",
+}
+
+
 class ImageCropper(QWidget):
     """Main window for image cropping application"""
 
@@ -81,6 +97,56 @@ class ImageCropper(QWidget):
         self.tooltipLabel = QLabel("", self)
         self.tooltipLabel.setAlignment(Qt.AlignLeft | Qt.AlignBottom)
 
+        self.statusLabel = QLabel("", self)
+        self.statusLabel.setAlignment(Qt.AlignRight | Qt.AlignBottom)
+
+        self.session = ImageSession(self)
+        self.session.loading_started.connect(self.on_loading_started)
+        self.session.preview_ready.connect(self.on_preview_loaded)
+        self.session.image_ready.connect(self.on_image_loaded)
+        self.session.failed.connect(self.on_load_failed)
+
+        thumbnail_db = os.path.join(os.path.dirname(__file__), "cache", "thumbnails.db")
+        self.thumbnail_loader = ThumbnailLoader(ThumbnailStore(thumbnail_db), self)
+        self.thumbnail_loader.compact()
+        self.thumbnail_strip = ThumbnailStrip(self.thumbnail_loader, self)
+        self.thumbnail_strip.setVisible(False)
+        self.thumbnail_strip.image_activated.connect(self.session.select)
+        self.session.current_changed.connect(self.thumbnail_strip.set_current)
+
+        self.nextImageShortcut = QShortcut(self)
+        self.nextImageShortcut.activated.connect(self.session.next)
+        self.previousImageShortcut = QShortcut(self)
+        self.previousImageShortcut.activated.connect(self.session.previous)
+        self.zoomInShortcut = QShortcut(self)
+        self.zoomInShortcut.activated.connect(self.canvas.zoom_in)
+        self.zoomOutShortcut = QShortcut(self)
+        self.zoomOutShortcut.activated.connect(self.canvas.zoom_out)
+        self.zoomFitShortcut = QShortcut(self)
+        self.zoomFitShortcut.activated.connect(self.canvas.zoom_fit)
+        self.overlayShortcut = QShortcut(self)
+        self.overlayShortcut.activated.connect(self.toggle_overlay)
+        self.traceShortcut = QShortcut(self)
+        self.traceShortcut.activated.connect(self.export_trace)
+
+        self.preview_renderer = PreviewRenderer(self)
+
+        self.export_settings = ExportSettings()
+        self.export_queue = ExportQueue(self)
+        self.export_queue.progress.connect(self.on_export_progress)
+        self.export_queue.finished.connect(self.on_export_finished)
+        self.export_queue.failed.connect(self.on_export_failed)
+        # Recipe steps waiting for their export, by output path
+        self.pending_crops = {}
+
+        self.recipe_path = os.path.join(os.path.dirname(__file__), "output", "recipe.json")
+        try:
+            self.recipe = CropRecipe.load(self.recipe_path)
+        except (OSError, ValueError):
+            self.recipe = CropRecipe()
+        self.recipe_replayer = RecipeReplayer(self)
+        self.recipe_replayer.finished.connect(self.on_replay_finished)
+
         self.upLoadButton = ToolTipsButton(
             "", "Click to upload image", self
         )
@@ -88,6 +154,13 @@ class ImageCropper(QWidget):
         self.upLoadButton.setIconSize(QSize(24, 24))
         self.upLoadButton.setFixedSize(40, 40)
 
+        self.openFolderButton = ToolTipsButton(
+            "", "Open a folder of images", self
+        )
+        self.openFolderButton.setIcon(QIcon("icons/open-folder.svg"))
+        self.openFolderButton.setIconSize(QSize(24, 24))
+        self.openFolderButton.setFixedSize(40, 40)
+
         self.webImportButton = ToolTipsButton(
             "", "Import image from web", self
         )
@@ -95,6 +168,13 @@ class ImageCropper(QWidget):
         self.webImportButton.setIconSize(QSize(24, 24))
         self.webImportButton.setFixedSize(40, 40)
 
+        self.replayButton = ToolTipsButton(
+            "", "Replay a crop recipe", self
+        )
+        self.replayButton.setIcon(QIcon("icons/replay-recipe.svg"))
+        self.replayButton.setIconSize(QSize(24, 24))
+        self.replayButton.setFixedSize(40, 40)
+
         self.resolution_group = QHBoxLayout()
 
         self.resolution_combo = QComboBox(self)
@@ -109,6 +189,18 @@ class ImageCropper(QWidget):
         )
         self.resolution_input.returnPressed.connect(self.get_resolution)
 
+        self.format_combo = QComboBox(self)
+        self.format_combo.addItems(list(EXPORT_FORMATS))
+
+        self.mode_combo = QComboBox(self)
+        self.mode_combo.addItem("Single size")
+        self.mode_combo.addItem("Fan-out")
+        self.mode_combo.addItems(list(RESAMPLE_MODES))
+        self.mode_combo.setToolTip(
+            "Fan-out also exports every smaller preset of the same crop, "
+            "Resampled crops by aspect ratio and scales to the exact resolution"
+        )
+
         self.cropButton = ToolTipsButton(
             "", "Crop the image according to the set solution", self
         )
@@ -126,6 +218,13 @@ class ImageCropper(QWidget):
         self.rotateRightButton.setIconSize(QSize(24, 24))
         self.rotateRightButton.setFixedSize(40, 40)
 
+        self.autoCropButton = ToolTipsButton(
+            "", "Place the crop on the most detailed area", self
+        )
+        self.autoCropButton.setIcon(QIcon("icons/auto-crop.svg"))
+        self.autoCropButton.setIconSize(QSize(24, 24))
+        self.autoCropButton.setFixedSize(40, 40)
+
         self.previewButton = ToolTipsButton(
             "", "Preview of the image after Crop", self
         )
@@ -135,9 +234,14 @@ class ImageCropper(QWidget):
 
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.upLoadButton)
+        button_layout.addWidget(self.openFolderButton)
         button_layout.addWidget(self.webImportButton)
+        button_layout.addWidget(self.replayButton)
         button_layout.addWidget(self.resolution_combo)
         button_layout.addWidget(self.resolution_input)
+        button_layout.addWidget(self.format_combo)
+        button_layout.addWidget(self.mode_combo)
+        button_layout.addWidget(self.autoCropButton)
         button_layout.addWidget(self.cropButton)
         button_layout.addWidget(self.rotateLeftButton)
         button_layout.addWidget(self.rotateRightButton)
@@ -149,12 +253,14 @@ class ImageCropper(QWidget):
         
         main_layout.addLayout(button_layout)
         main_layout.addWidget(self.canvas, 1)
+        main_layout.addWidget(self.thumbnail_strip)
         
         bottom_layout = QHBoxLayout()
         bottom_layout.addWidget(self.tooltipLabel)
         bottom_layout.addItem(
             QSpacerItem(0, 0, QSizePolicy.Expanding, QSizePolicy.Minimum)
         )
+        bottom_layout.addWidget(self.statusLabel)
         main_layout.addLayout(bottom_layout)
         
         window_layout = QVBoxLayout(self)
@@ -164,17 +270,26 @@ class ImageCropper(QWidget):
         window_layout.addWidget(main_container)
 
         self.load_shortcut_config()
+        self.load_export_config()
+        self.load_session_config()
         self.upLoadButton.clicked.connect(self.load_image)
+        self.openFolderButton.clicked.connect(self.load_folder)
         self.webImportButton.clicked.connect(self.import_from_web)
+        self.replayButton.clicked.connect(self.replay_recipe)
         self.resolution_combo.currentIndexChanged.connect(self.on_combo_changed)
+        self.mode_combo.currentIndexChanged.connect(self.on_mode_changed)
         self.rotateLeftButton.clicked.connect(lambda: self.rotate_image(-90))
         self.rotateRightButton.clicked.connect(lambda: self.rotate_image(90))
         self.previewButton.clicked.connect(self.preview_crop)
         self.cropButton.clicked.connect(self.crop_image)
+        self.autoCropButton.clicked.connect(self.auto_crop)
 
         self.upLoadButton.tooltip_message.connect(self.set_tooltip_text)
+        self.openFolderButton.tooltip_message.connect(self.set_tooltip_text)
         self.webImportButton.tooltip_message.connect(self.set_tooltip_text)
+        self.replayButton.tooltip_message.connect(self.set_tooltip_text)
         self.cropButton.tooltip_message.connect(self.set_tooltip_text)
+        self.autoCropButton.tooltip_message.connect(self.set_tooltip_text)
         self.rotateLeftButton.tooltip_message.connect(self.set_tooltip_text)
         self.rotateRightButton.tooltip_message.connect(self.set_tooltip_text)
         self.previewButton.tooltip_message.connect(self.set_tooltip_text)
@@ -182,23 +297,32 @@ class ImageCropper(QWidget):
 
         self.current_resolution_width = None
         self.current_resolution_height = None
+        self.showing_preview = False
+        self.image_path = None
 
         self.setStyleSheet(Styles.MAIN_WIDGET)
         self.upLoadButton.setStyleSheet(Styles.UPLOAD_BUTTON)
+        self.openFolderButton.setStyleSheet(Styles.UPLOAD_BUTTON)
         self.webImportButton.setStyleSheet(Styles.UPLOAD_BUTTON)  # Using same style as upload button
+        self.replayButton.setStyleSheet(Styles.UPLOAD_BUTTON)
         self.cropButton.setStyleSheet(Styles.CROP_BUTTON)
+        self.autoCropButton.setStyleSheet(Styles.CROP_BUTTON)
         self.rotateLeftButton.setStyleSheet(Styles.ROTATE_LEFT_BUTTON)
         self.rotateRightButton.setStyleSheet(Styles.ROTATE_RIGHT_BUTTON)
         self.previewButton.setStyleSheet(Styles.PREVIEW_BUTTON)
         self.resolution_input.setStyleSheet(Styles.RESOLUTION_INPUT)
         self.resolution_combo.setStyleSheet(Styles.RESOLUTION_COMBO)
+        self.format_combo.setStyleSheet(Styles.RESOLUTION_COMBO)
+        self.mode_combo.setStyleSheet(Styles.RESOLUTION_COMBO)
         self.tooltipLabel.setStyleSheet(Styles.TOOLTIP_LABEL)
+        self.statusLabel.setStyleSheet(Styles.TOOLTIP_LABEL)
 
         self.disable_controls()
 
     def disable_controls(self):
         """Disable all controls except upload button"""
         self.cropButton.setEnabled(False)
+        self.autoCropButton.setEnabled(False)
         self.rotateLeftButton.setEnabled(False)
         self.rotateRightButton.setEnabled(False)
         self.previewButton.setEnabled(False)
@@ -208,6 +332,7 @@ class ImageCropper(QWidget):
     def enable_controls(self):
         """Enable all controls"""
         self.cropButton.setEnabled(True)
+        self.autoCropButton.setEnabled(True)
         self.rotateLeftButton.setEnabled(True)
         self.rotateRightButton.setEnabled(True)
         self.previewButton.setEnabled(True)
@@ -217,10 +342,19 @@ class ImageCropper(QWidget):
     def set_default_shortcuts(self):
         """Set the default shortcuts for the buttons"""
         self.upLoadButton.setShortcut("Ctrl+O")
+        self.openFolderButton.setShortcut("Ctrl+Shift+O")
         self.cropButton.setShortcut("Ctrl+Return")
+        self.autoCropButton.setShortcut("Ctrl+Shift+A")
         self.rotateLeftButton.setShortcut("Ctrl+Left")
         self.rotateRightButton.setShortcut("Ctrl+Right")
         self.previewButton.setShortcut("Ctrl+P")
+        self.nextImageShortcut.setKey("PgDown")
+        self.previousImageShortcut.setKey("PgUp")
+        self.zoomInShortcut.setKey("Ctrl+=")
+        self.zoomOutShortcut.setKey("Ctrl+-")
+        self.zoomFitShortcut.setKey("Ctrl+0")
+        self.overlayShortcut.setKey("F12")
+        self.traceShortcut.setKey("Ctrl+Shift+T")
 
     def load_shortcut_config(self):
         """Load the shortcut configuration from file"""
@@ -230,9 +364,15 @@ class ImageCropper(QWidget):
             self.upLoadButton.setShortcut(
                 QKeySequence(config.get("load_image", "Ctrl+O"))
             )
+            self.openFolderButton.setShortcut(
+                QKeySequence(config.get("open_folder", "Ctrl+Shift+O"))
+            )
             self.cropButton.setShortcut(
                 QKeySequence(config.get("crop_image", "Ctrl+Return"))
             )
+            self.autoCropButton.setShortcut(
+                QKeySequence(config.get("auto_crop", "Ctrl+Shift+A"))
+            )
             self.rotateLeftButton.setShortcut(
                 QKeySequence(config.get("rotate_left", "Ctrl+Left"))
             )
@@ -242,6 +382,27 @@ class ImageCropper(QWidget):
             self.previewButton.setShortcut(
                 QKeySequence(config.get("preview_crop", "Ctrl+P"))
             )
+            self.nextImageShortcut.setKey(
+                QKeySequence(config.get("next_image", "PgDown"))
+            )
+            self.previousImageShortcut.setKey(
+                QKeySequence(config.get("previous_image", "PgUp"))
+            )
+            self.zoomInShortcut.setKey(
+                QKeySequence(config.get("zoom_in", "Ctrl+="))
+            )
+            self.zoomOutShortcut.setKey(
+                QKeySequence(config.get("zoom_out", "Ctrl+-"))
+            )
+            self.zoomFitShortcut.setKey(
+                QKeySequence(config.get("zoom_fit", "Ctrl+0"))
+            )
+            self.overlayShortcut.setKey(
+                QKeySequence(config.get("toggle_overlay", "F12"))
+            )
+            self.traceShortcut.setKey(
+                QKeySequence(config.get("export_trace", "Ctrl+Shift+T"))
+            )
         except FileNotFoundError:
             self.set_default_shortcuts()
         except json.JSONDecodeError:
@@ -249,10 +410,42 @@ class ImageCropper(QWidget):
         except Exception as e:
             self.set_default_shortcuts()
 
+    def load_export_config(self):
+        """Load the encoder settings for exported images from file"""
+        try:
+            with open("config.json", "r") as file:
+                config = json.load(file)
+            self.export_settings = ExportSettings(
+                config.get("export_format", "PNG"),
+                config.get("export_quality", 90),
+                config.get("png_compression", 6),
+            )
+            self.fanout_sizes = parse_sizes(config.get("fanout_sizes", ["720p", "1080p", "1440p"]))
+            self.fanout_template = config.get("fanout_template", "crop_{timestamp}_{label}.{ext}")
+        except (OSError, ValueError):
+            self.export_settings = ExportSettings()
+            self.fanout_sizes = parse_sizes(["720p", "1080p", "1440p"])
+            self.fanout_template = "crop_{timestamp}_{label}.{ext}"
+        self.format_combo.setCurrentText(self.export_settings.format)
+
+    def load_session_config(self):
+        """Load the decoded image cache limits from file"""
+        try:
+            with open("config.json", "r") as file:
+                config = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.session.max_images = max(1, int(config.get("session_max_images", 5)))
+        self.session.memory_limit = int(config.get("session_memory_mb", 2048)) * 1024 * 1024
+
     def set_tooltip_text(self, message):
         """set the tooltip text"""
         self.tooltipLabel.setText(message)
 
+    def set_status_text(self, message):
+        """set the status text"""
+        self.statusLabel.setText(message)
+
     def on_combo_changed(self, index):
         """Handle resolution preset selection from dropdown"""
         if index == 0:
@@ -269,14 +462,56 @@ class ImageCropper(QWidget):
             self.get_resolution()
 
     def load_image(self):
-        """Load and display an image from file system"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "Open Image", "", "Image files (*.jpg *.png *.jpeg)"
+        """Load one or more images from file system and display the first"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Open Images", "", "Image files (*.jpg *.png *.jpeg *.tif *.tiff)"
         )
-        if file_path:
-            pixmap = QPixmap(file_path)
-            self.canvas.set_image(pixmap)
+        if file_paths:
+            self.thumbnail_strip.set_paths(file_paths)
+            self.session.open(file_paths)
+
+    def load_folder(self):
+        """Open every image in a folder as a thumbnail strip without decoding any of them"""
+        folder = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if not folder:
+            return
+        file_paths = collect_images(folder)
+        if not file_paths:
+            StyleMessageBox.warning(self, "Warning", "No images found in this folder")
+            return
+        self.thumbnail_strip.set_paths(file_paths)
+        self.session.open(file_paths, show_first=len(file_paths) == 1)
+        self.set_status_text(f"{len(file_paths)} images")
+
+    def on_loading_started(self, file_path):
+        """Show the progress state while an image is being decoded"""
+        self.disable_controls()
+        self.setCursor(Qt.BusyCursor)
+        self.set_status_text(f"Loading {os.path.basename(file_path)}...")
+
+    def on_preview_loaded(self, image):
+        """Show the downscaled preview while the full image is still decoding"""
+        self.canvas.set_image(image)
+        self.image_path = self.session.current_path()
+        self.showing_preview = True
+        self.set_status_text(f"{self.statusLabel.text()} (preview)")
+
+    def on_image_loaded(self, image, pyramid=None):
+        """Swap in the full resolution image once decoding has finished"""
+        self.canvas.set_image(image, pyramid)
+        self.image_path = self.session.current_path()
+        self.showing_preview = False
+        self.unsetCursor()
+        self.set_status_text("")
+        self.enable_controls()
+
+    def on_load_failed(self, message):
+        """Report an image that could not be decoded"""
+        self.unsetCursor()
+        self.set_status_text("")
+        if self.canvas.source_image and not self.showing_preview:
             self.enable_controls()
+        StyleMessageBox.warning(self, "Warning", f"Image could not be loaded: {message}")
 
     def import_from_web(self):
         """Import image from web dialog"""
@@ -287,10 +522,11 @@ class ImageCropper(QWidget):
         except Exception as e:
             StyleMessageBox.critical(self, "Error", f"Error opening web import: {str(e)}")
 
-    def set_imported_image(self, pixmap):
+    def set_imported_image(self, image):
         """Process the image imported from the web"""
-        if not pixmap.isNull():
-            self.canvas.load_pixmap(pixmap)
+        if not image.isNull():
+            self.image_path = None
+            self.canvas.set_image(image)
             self.enable_controls()
         else:
             StyleMessageBox.warning(self, "Warning", "Selected image could not be loaded.")
@@ -313,15 +549,10 @@ class ImageCropper(QWidget):
             return
 
         try:
-            width, height = map(int, resolution.split("x"))
-            if self.canvas.set_selection_size(width, height):
+            width, height = parse_resolution(resolution)
+            if self.apply_selection_size(width, height):
                 self.current_resolution_width = width
                 self.current_resolution_height = height
-                cropped_image = self.canvas.get_cropped_image()
-                if cropped_image:
-                    print(
-                        f"Cropped image size: {cropped_image.width()}x{cropped_image.height()}"
-                    )
                 if not is_from_combo:
                     self.resolution_combo.setCurrentIndex(0)
             else:
@@ -338,14 +569,13 @@ class ImageCropper(QWidget):
         """Rotate the image by specified degrees"""
         if self.canvas.rotate_image(degrees):
             if self.current_resolution_height and self.current_resolution_width:
-                current_image_width = self.canvas.original_pixmap.width()
-                current_image_height = self.canvas.original_pixmap.height()
+                current_image_width, current_image_height = self.canvas.image_size()
 
-                if (
+                if self.resample_filter() or (
                     self.current_resolution_height <= current_image_height
                     and self.current_resolution_width <= current_image_width
                 ):
-                    self.canvas.set_selection_size(
+                    self.apply_selection_size(
                         self.current_resolution_width, self.current_resolution_height
                     )
                 else:
@@ -359,16 +589,86 @@ class ImageCropper(QWidget):
                     self.current_resolution_width = None
                     self.current_resolution_height = None
 
+    def toggle_overlay(self):
+        """Show or hide the performance overlay on the canvas"""
+        self.canvas.set_overlay_visible(not self.canvas.show_overlay)
+
+    def export_trace(self):
+        """Write the recorded spans as a Chrome trace to the output directory"""
+        if not instrumentation.is_enabled():
+            instrumentation.enable()
+            self.set_status_text("Tracing started, press again to save the trace")
+            return
+        output_dir = os.path.join(os.path.dirname(__file__), "output")
+        path = os.path.join(output_dir, f"trace_{int(time.time() * 1000)}.json")
+        try:
+            events = instrumentation.export_chrome_trace(path)
+        except OSError as e:
+            StyleMessageBox.warning(self, "Trace Failed", f"Could not write trace: {e}")
+            return
+        self.set_status_text(f"Saved {events} trace events to {os.path.basename(path)}")
+
+    def auto_crop(self):
+        """Place the selection for the current resolution on the most detailed area"""
+        if not self.canvas.source_image:
+            return
+        try:
+            width, height = parse_resolution(self.resolution_input.text())
+        except ValueError:
+            StyleMessageBox.warning(
+                self,
+                "No Resolution",
+                "Please either select a preset resolution or enter a custom one."
+            )
+            return
+        if self.resample_filter():
+            selection_width, selection_height = aspect_size(*self.canvas.image_size(), width, height)
+        else:
+            selection_width, selection_height = width, height
+        if self.canvas.auto_place_selection(selection_width, selection_height):
+            self.current_resolution_width = width
+            self.current_resolution_height = height
+
+    def resample_filter(self):
+        """Return the filter of the selected resampled export mode, or None"""
+        return RESAMPLE_MODES.get(self.mode_combo.currentText())
+
+    def apply_selection_size(self, width, height):
+        """Size the selection for a target resolution
+
+        In a resampled mode the selection is the largest rect with the target
+        aspect ratio, so the target may be larger than the image.
+        """
+        if self.resample_filter():
+            width, height = aspect_size(*self.canvas.image_size(), width, height)
+        return self.canvas.set_selection_size(width, height)
+
+    def on_mode_changed(self, index):
+        """Resize the selection when switching between native and resampled crops"""
+        if self.canvas.source_image and self.current_resolution_width and self.current_resolution_height:
+            if not self.apply_selection_size(self.current_resolution_width, self.current_resolution_height):
+                self.current_resolution_width = None
+                self.current_resolution_height = None
+
     def preview_crop(self):
         """Show preview of the cropped image"""
         cropped = self.canvas.get_cropped_image()
         if cropped:
-            preview = PreviewDialog(cropped, self)
+            # Open with a cut of the display pyramid, the full resolution
+            # rendering replaces it once the worker is done
+            image = self.preview_renderer.render(cropped, 780, 580, self.canvas.pyramid)
+            preview = PreviewDialog(QPixmap.fromImage(image), self, cropped, self.canvas.pyramid)
+            refine = lambda refined: preview.set_pixmap(QPixmap.fromImage(refined))
+            self.preview_renderer.refined.connect(refine)
             preview.exec_()
+            self.preview_renderer.refined.disconnect(refine)
+            self.preview_renderer.cancel()
+            # The dialog pins the source through its tiles, release it now
+            preview.deleteLater()
 
     def crop_image(self):
         """Combined function for handling crop operations"""
-        if not self.canvas.original_pixmap:
+        if not self.canvas.source_image:
             return
 
         if not self.current_resolution_width or not self.current_resolution_height:
@@ -382,8 +682,8 @@ class ImageCropper(QWidget):
                 return
 
             try:
-                width, height = map(int, resolution.split("x"))
-                if not self.canvas.set_selection_size(width, height):
+                width, height = parse_resolution(resolution)
+                if not self.apply_selection_size(width, height):
                     return
                 self.current_resolution_width = width
                 self.current_resolution_height = height
@@ -400,10 +700,146 @@ class ImageCropper(QWidget):
 
         cropped = self.canvas.get_cropped_image()
         if cropped:
-            filename = f"crop_{int(time.time())}.png"
-            filepath = os.path.join(output_dir, filename)
-            cropped.save(filepath)
-            StyleMessageBox.information(self, "Success", f"Image saved as {filename}")
+            settings = ExportSettings(
+                self.format_combo.currentText(),
+                self.export_settings.quality,
+                self.export_settings.png_compression,
+            )
+            resample_filter = self.resample_filter()
+            if self.mode_combo.currentText() == "Fan-out":
+                filepaths = self.export_fanout(cropped, output_dir, settings)
+                if not filepaths:
+                    return
+            else:
+                filename = f"crop_{int(time.time() * 1000)}.{settings.extension}"
+                filepath = os.path.join(output_dir, filename)
+                if resample_filter:
+                    self.export_queue.enqueue(
+                        cropped,
+                        filepath,
+                        settings,
+                        (self.current_resolution_width, self.current_resolution_height),
+                        resample_filter,
+                    )
+                else:
+                    self.export_queue.enqueue(cropped, filepath, settings)
+                filepaths = [filepath]
+            self.record_crop(filepaths, resample_filter)
+
+    def export_fanout(self, cropped, output_dir, settings):
+        """Export the crop at every fan-out size that fits inside it"""
+        # The selection may have been resized by hand since the resolution was set
+        width, height = cropped.size()
+        sizes = [size for size in self.fanout_sizes if size[1] <= width and size[2] <= height]
+        if not sizes:
+            StyleMessageBox.warning(
+                self,
+                "No Fan-out Sizes",
+                f"None of the fan-out sizes fits inside a {width}x{height} crop."
+            )
+            return []
+        if (sizes[0][1], sizes[0][2]) != (width, height):
+            sizes.insert(0, (f"{width}x{height}", width, height))
+
+        timestamp = int(time.time() * 1000)
+        outputs = []
+        for label, size_width, size_height in sizes:
+            filepath = os.path.join(
+                output_dir,
+                fanout_name(
+                    self.fanout_template, "crop", label, size_width, size_height,
+                    settings.extension, timestamp,
+                ),
+            )
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            outputs.append((size_width, size_height, filepath))
+        self.export_queue.enqueue_fanout(cropped, outputs, settings)
+        return [filepath for _, _, filepath in outputs]
+
+    def record_crop(self, filepaths, resample_filter=None):
+        """Remember the crop of a file-backed image until one of filepaths is exported"""
+        if not self.image_path:
+            return
+        image_width, image_height = self.canvas.image_size()
+        rect = self.canvas.get_crop_rect()
+        # Native crops are exported at the selection size, which may have
+        # been resized by hand, resampled ones at the chosen resolution
+        if resample_filter:
+            width, height = self.current_resolution_width, self.current_resolution_height
+        else:
+            width, height = rect.width(), rect.height()
+        step = (
+            self.image_path,
+            self.canvas.rotation,
+            rect,
+            image_width,
+            image_height,
+            width,
+            height,
+            resample_filter,
+        )
+        for filepath in filepaths:
+            self.pending_crops[filepath] = step
+
+    def on_export_finished(self, filepath):
+        """Add the crop behind a written export to the recipe"""
+        step = self.pending_crops.pop(filepath, None)
+        if step is None:
+            return
+        # A fan-out is recorded once, for whichever of its outputs is written first
+        for other in [path for path, pending in self.pending_crops.items() if pending is step]:
+            del self.pending_crops[other]
+        self.recipe.record(*step)
+        try:
+            self.recipe.save(self.recipe_path)
+        except OSError as e:
+            StyleMessageBox.warning(self, "Warning", f"Crop recipe could not be saved: {e}")
+
+    def replay_recipe(self):
+        """Re-crop every image of a recipe, at the current resolution if one is set"""
+        if self.recipe_replayer.is_running():
+            return
+        filepath, _ = QFileDialog.getOpenFileName(
+            self, "Open Crop Recipe", self.recipe_path, "Crop recipes (*.json)"
+        )
+        if not filepath:
+            return
+        try:
+            recipe = CropRecipe.load(filepath)
+        except (OSError, ValueError) as e:
+            StyleMessageBox.warning(self, "Warning", f"Crop recipe could not be read: {e}")
+            return
+        self.recipe_replayer.replay(
+            recipe,
+            width=self.current_resolution_width,
+            height=self.current_resolution_height,
+        )
+        self.set_status_text(f"Replaying {len(recipe)} crops...")
+
+    def on_replay_finished(self, succeeded, failed, seconds):
+        """Report the result of a recipe replay"""
+        self.set_status_text(f"Replayed {len(succeeded)} crops in {seconds:.1f}s, saved in output")
+        if failed:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in failed[:10])
+            StyleMessageBox.warning(self, "Replay Failed", f"{len(failed)} crops failed:\n{details}")
+
+    def on_export_progress(self, completed, failed, queued):
+        """Show the number of finished and failed exports in the status label"""
+        pending = queued - completed - failed
+        status = f"Exported {completed}/{queued}"
+        if failed:
+            status += f", {failed} failed"
+        if pending:
+            self.set_status_text(f"{status} ({pending} encoding)")
+        elif failed:
+            self.set_status_text(status)
+        else:
+            self.set_status_text(f"{status}, saved in output")
+
+    def on_export_failed(self, filepath, message):
+        """Report an export that could not be written"""
+        self.pending_crops.pop(filepath, None)
+        StyleMessageBox.warning(self, "Export Failed", message)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton and self.title_bar.geometry().contains(event.pos()):
@@ -423,7 +859,12 @@ class ImageCropper(QWidget):
 
     def update_resolution_input(self, width, height):
         """Update resolution input when selection size changes"""
-        self.resolution_input.setText(f"{width}x{height}")
+        if self.resample_filter():
+            # The selection only fixes the area, the output keeps the target resolution
+            return
+        resolution = f"{width}x{height}"
+        if self.resolution_input.text() != resolution:
+            self.resolution_input.setText(resolution)
         self.resolution_combo.setCurrentIndex(0)
 
 
@@ -1,22 +1,55 @@
-from PySide6.QtCore import Qt, QRect, QSize, QPoint, Signal
-from PySide6.QtGui import QPainter, QColor, QPen, QPixmap, QTransform, QCursor
+import time
+from collections import deque
+
+from PySide6.QtCore import Qt, QRect, QRectF, QSize, QPoint, QPointF, QTimer, Signal
+from PySide6.QtGui import QPainter, QColor, QPen, QPixmap, QTransform, QCursor, QFont
 from PySide6.QtWidgets import QLabel, QMessageBox
 from widget.message_box import StyleMessageBox
+from core import instrumentation
+from core.autocrop import PROXY_SIZE, proxy_image, suggest_crop
+from core.crop_engine import rotated_size, source_rect, transpose
+from core.crop_view import CropView
+from core.pyramid import ImagePyramid
+from core.tiles import TILE_SIZE, TileCache, TileRenderer, tile_grid, zoom_scales
+
+
+BACKGROUND_COLOR = QColor(44, 44, 44)
+DIM_COLOR = QColor(0, 0, 0, 110)
+
+# selection_size_changed is emitted at most once per frame while resizing
+SIZE_SIGNAL_INTERVAL_MS = 16
+
+# Tiles of the zoomed image kept across zoom levels and pans
+TILE_CACHE_BYTES = 192 * 1024 * 1024
+
+OVERLAY_RECT = QRect(8, 8, 300, 132)
+OVERLAY_INTERVAL_MS = 500
+OVERLAY_OPERATIONS = (
+    "decode", "update_display", "rotate_image", "get_cropped_image", "encode", "download",
+)
 
 
 class Canvas(QLabel):
-    """Widget for displaying and interacting with the image"""
+    """Widget for displaying and interacting with the image
+
+    The selection is kept in image pixels (of the rotated image), so it is
+    exact at every zoom. At the fit zoom the whole image is drawn from one
+    pixmap scaled off the pyramid. Closer zooms are drawn from tiles that
+    worker threads render from the matching pyramid level or the source;
+    the fit pixmap scaled up covers every tile that is not ready yet.
+    """
 
     selection_size_changed = Signal(int, int)
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.pixmap = None
-        self.rect = QRect(0, 0, 0, 0)
+        self.pyramid = None
+        # The crop in rotated image coordinates
+        self.selection = QRect()
         self.dragging = False
         self.scale_factor = 1.0
-        self.offset = QPoint(0, 0)
-        self.original_pixmap = None
+        self.offset = QPointF(0, 0)
+        self.source_image = None
         self.displayed_pixmap = None
         self.display_scale = 1.0
         self.original_size = None
@@ -24,6 +57,8 @@ class Canvas(QLabel):
         self.setMinimumSize(400, 300)
         self.setAlignment(Qt.AlignCenter)
         self.setStyleSheet("QLabel { background-color: #2c2c2c; }")
+        # paintEvent fills every pixel itself, Qt need not clear the background first
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
         self.resize_margin = 10
         self.resizing = False
         self.resize_edge = None
@@ -31,59 +66,229 @@ class Canvas(QLabel):
         self.last_rect = None
         self.show_selection = False
 
+        # Zoom step of zoom_scales(), 0 is fit, and the pan in zoomed pixels
+        self.scale_index = 0
+        self.pan = QPointF(0, 0)
+        self.panning = False
+        self.tile_cache = TileCache(TILE_CACHE_BYTES)
+        self.tile_renderer = TileRenderer(self)
+        self.tile_renderer.tile_ready.connect(self.on_tile_ready)
+
+        self.pending_size = None
+        self.size_updates_requested = 0
+        self.size_updates_emitted = 0
+        self.size_timer = QTimer(self)
+        self.size_timer.setSingleShot(True)
+        self.size_timer.setInterval(SIZE_SIGNAL_INTERVAL_MS)
+        self.size_timer.timeout.connect(self.flush_selection_size)
+
+        self.show_overlay = False
+        self.frame_times = deque(maxlen=60)
+        self.overlay_timer = QTimer(self)
+        self.overlay_timer.setInterval(OVERLAY_INTERVAL_MS)
+        self.overlay_timer.timeout.connect(lambda: self.update(OVERLAY_RECT))
+
         self.setMouseTracking(True)
 
-    def set_image(self, pixmap):
-        """Set and initialize the image to be displayed"""
-        self.original_pixmap = pixmap
-        self.original_size = (pixmap.width(), pixmap.height())
-        print(f"Original image size: {pixmap.width()}x{pixmap.height()}")
-        self.pixmap = pixmap
+    @instrumentation.timed("set_image")
+    def set_image(self, image, pyramid=None):
+        """Set and initialize the QImage or TiledImage to be displayed"""
+        self.source_image = image
+        self.original_size = (image.width(), image.height())
+        self.pyramid = pyramid or ImagePyramid.for_source(image)
+        self.rotation = 0
         self.show_selection = False
+        self.reset_view()
         self.update_display()
 
+    def image_size(self):
+        """Return the (width, height) of the image as currently rotated"""
+        return rotated_size(
+            self.source_image.width(), self.source_image.height(), self.rotation
+        )
+
+    def reset_view(self):
+        """Zoom to fit, select the whole image and restart the tiles for the rotation"""
+        self.scale_index = 0
+        self.pan = QPointF(0, 0)
+        self.selection = QRect(0, 0, *self.image_size())
+        self.tile_cache.clear()
+        self.tile_renderer.set_source(
+            CropView(self.source_image, QRect(0, 0, *self.original_size), self.rotation),
+            self.pyramid,
+        )
+
+    @instrumentation.timed("update_display")
     def update_display(self):
-        """Update the displayed image and selection box after resize or load"""
-        if self.pixmap:
+        """Update the displayed image after resize or load"""
+        if self.source_image:
             parent = self.parent()
             if parent:
                 available_width = self.width()
                 available_height = self.height()
+                image_width, image_height = self.image_size()
 
                 self.display_scale = min(
-                    available_width / self.pixmap.width(),
-                    available_height / self.pixmap.height(),
+                    available_width / image_width,
+                    available_height / image_height,
                 )
 
-                scaled_width = int(self.pixmap.width() * self.display_scale)
-                scaled_height = int(self.pixmap.height() * self.display_scale)
+                scaled_width = int(image_width * self.display_scale)
+                scaled_height = int(image_height * self.display_scale)
 
-                scaled_pixmap = self.pixmap.scaled(
-                    scaled_width,
-                    scaled_height,
-                    Qt.KeepAspectRatio,
-                    Qt.SmoothTransformation,
+                # Scale from the smallest cached level that still covers the viewport,
+                # rotation is applied afterwards to the display-sized copy only
+                level_width, level_height = rotated_size(
+                    scaled_width, scaled_height, self.rotation
+                )
+                source = self.pyramid.level_for(level_width, level_height)
+                scaled_pixmap = QPixmap.fromImage(
+                    transpose(
+                        source.scaled(
+                            level_width,
+                            level_height,
+                            Qt.IgnoreAspectRatio,
+                            Qt.SmoothTransformation,
+                        ),
+                        self.rotation,
+                    )
                 )
 
                 self.displayed_pixmap = scaled_pixmap
-                self.setPixmap(scaled_pixmap)
+                self.clamp_pan()
+                self.update()
+
+    def display_rect(self):
+        """Return where the displayed pixmap is drawn in widget coordinates"""
+        if not self.displayed_pixmap:
+            return QRect()
+        return QRect(
+            (self.width() - self.displayed_pixmap.width()) // 2,
+            (self.height() - self.displayed_pixmap.height()) // 2,
+            self.displayed_pixmap.width(),
+            self.displayed_pixmap.height(),
+        )
 
-                self.rect = QRect(
-                    (self.width() - scaled_width) // 2,
-                    (self.height() - scaled_height) // 2,
-                    scaled_width,
-                    scaled_height,
-                )
+    def scales(self):
+        return zoom_scales(self.display_scale)
+
+    def scale(self):
+        """Return the current zoom, widget pixels per image pixel"""
+        if not self.scale_index:
+            return self.display_scale
+        scales = self.scales()
+        return scales[min(self.scale_index, len(scales) - 1)]
+
+    def image_rect(self):
+        """Return where the image lies in widget coordinates at the current zoom"""
+        if not self.scale_index:
+            return QRectF(self.display_rect())
+        width, height = self.zoomed_size()
+        left = (self.width() - width) // 2 if width < self.width() else -self.pan.x()
+        top = (self.height() - height) // 2 if height < self.height() else -self.pan.y()
+        return QRectF(left, top, width, height)
+
+    def zoomed_size(self):
+        image_width, image_height = self.image_size()
+        scale = self.scale()
+        return max(1, round(image_width * scale)), max(1, round(image_height * scale))
+
+    def clamp_pan(self):
+        if not self.scale_index:
+            return
+        # Whole pixels keep the tiles aligned to the widget pixel grid
+        width, height = self.zoomed_size()
+        self.pan = QPointF(
+            max(0, min(round(self.pan.x()), width - self.width())),
+            max(0, min(round(self.pan.y()), height - self.height())),
+        )
+
+    def to_image(self, pos):
+        """Map a widget position to (fractional) image coordinates"""
+        origin = self.image_rect().topLeft()
+        return (QPointF(pos) - origin) / self.scale()
+
+    def to_widget(self, rect):
+        """Map a rect in image coordinates to a QRect in widget coordinates"""
+        origin = self.image_rect().topLeft()
+        scale = self.scale()
+        left = round(origin.x() + rect.x() * scale)
+        top = round(origin.y() + rect.y() * scale)
+        right = round(origin.x() + (rect.x() + rect.width()) * scale)
+        bottom = round(origin.y() + (rect.y() + rect.height()) * scale)
+        return QRect(left, top, right - left, bottom - top)
+
+    def selection_rect(self):
+        """Return the selection in widget coordinates"""
+        return self.to_widget(self.selection)
+
+    def zoom_to(self, index, anchor=None):
+        """Zoom to a step of scales(), keeping the image point under anchor in place"""
+        if not self.source_image or not self.displayed_pixmap:
+            return False
+        index = max(0, min(index, len(self.scales()) - 1))
+        if index == self.scale_index:
+            return False
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        point = self.to_image(anchor)
+        self.scale_index = index
+        self.pan = point * self.scale() - QPointF(anchor)
+        self.clamp_pan()
+        self.update()
+        return True
+
+    def zoom_in(self):
+        return self.zoom_to(self.scale_index + 1)
+
+    def zoom_out(self):
+        return self.zoom_to(self.scale_index - 1)
+
+    def zoom_fit(self):
+        return self.zoom_to(0)
+
+    def on_tile_ready(self, key, image):
+        self.tile_cache.put(key, QPixmap.fromImage(image))
+        scale, column, row = key
+        if self.scale_index and scale == self.scale():
+            origin = self.image_rect().topLeft()
+            self.update(
+                QRectF(
+                    origin.x() + column * TILE_SIZE, origin.y() + row * TILE_SIZE,
+                    image.width(), image.height(),
+                ).toAlignedRect()
+            )
+
+    def update_selection(self, old_rect):
+        """Repaint only the area covered by the previous and current selection"""
+        # Pad by the pen width so the old border is fully erased
+        self.update(old_rect.united(self.selection_rect()).adjusted(-2, -2, 2, 2))
+
+    def queue_selection_size(self, width, height):
+        """Coalesce size updates so at most one signal goes out per frame"""
+        self.pending_size = (width, height)
+        self.size_updates_requested += 1
+        if not self.size_timer.isActive():
+            self.size_timer.start()
+
+    def flush_selection_size(self):
+        """Emit the latest queued selection size, if any"""
+        self.size_timer.stop()
+        if self.pending_size:
+            self.size_updates_emitted += 1
+            self.selection_size_changed.emit(*self.pending_size)
+            self.pending_size = None
+
+    @property
+    def size_updates_coalesced(self):
+        return self.size_updates_requested - self.size_updates_emitted
 
     def set_selection_size(self, target_width, target_height):
         """Set the size of the selection rectangle based on target dimensions"""
-        if not self.original_pixmap:
+        if not self.source_image:
             return False
 
-        orig_width, orig_height = (
-            self.original_pixmap.width(),
-            self.original_pixmap.height(),
-        )
+        orig_width, orig_height = self.image_size()
 
         if target_width > orig_width or target_height > orig_height:
             StyleMessageBox.warning(
@@ -94,94 +299,212 @@ class Canvas(QLabel):
             )
             return False
 
-        display_rect_width = int(target_width * self.display_scale)
-        display_rect_height = int(target_height * self.display_scale)
-
-        display_rect_width = min(display_rect_width, self.displayed_pixmap.width())
-        display_rect_height = min(display_rect_height, self.displayed_pixmap.height())
-
-        image_x = (self.width() - self.displayed_pixmap.width()) // 2
-        image_y = (self.height() - self.displayed_pixmap.height()) // 2
-
-        x = image_x + (self.displayed_pixmap.width() - display_rect_width) // 2
-        y = image_y + (self.displayed_pixmap.height() - display_rect_height) // 2
-
-        self.rect.setRect(x, y, display_rect_width, display_rect_height)
+        self.selection = QRect(
+            (orig_width - target_width) // 2,
+            (orig_height - target_height) // 2,
+            target_width,
+            target_height,
+        )
         self.show_selection = True
         self.update()
         return True
 
-    def get_crop_rect(self):
-        """Calculate the crop rectangle in original image coordinates"""
-        if not self.original_pixmap or not self.displayed_pixmap:
-            return None
+    def auto_place_selection(self, target_width, target_height):
+        """Size the selection and move it onto the most interesting part of the image"""
+        if not self.set_selection_size(target_width, target_height):
+            return False
 
-        image_x = (self.width() - self.displayed_pixmap.width()) // 2
-        image_y = (self.height() - self.displayed_pixmap.height()) // 2
+        # Search on a small pyramid level, rotated like the display
+        base = self.pyramid.base
+        proxy_size = QSize(base.width(), base.height()).scaled(
+            PROXY_SIZE, PROXY_SIZE, Qt.KeepAspectRatio
+        )
+        proxy = transpose(
+            proxy_image(self.pyramid.level_for(proxy_size.width(), proxy_size.height())),
+            self.rotation,
+        )
+        image_width, image_height = self.image_size()
+        rect = suggest_crop(QSize(image_width, image_height), target_width, target_height, proxy)
 
-        relative_x = self.rect.x() - image_x
-        relative_y = self.rect.y() - image_y
+        old_rect = self.selection_rect()
+        self.selection.moveTo(rect.x(), rect.y())
+        self.update_selection(old_rect)
+        return True
 
-        original_x = int(relative_x / self.display_scale)
-        original_y = int(relative_y / self.display_scale)
-        original_width = int(self.rect.width() / self.display_scale)
-        original_height = int(self.rect.height() / self.display_scale)
+    def get_crop_rect(self):
+        """Calculate the crop rectangle in rotated image coordinates"""
+        if not self.source_image or not self.displayed_pixmap or self.selection.isEmpty():
+            return None
+        return QRect(self.selection)
 
-        original_x = max(
-            0, min(original_x, self.original_pixmap.width() - original_width)
-        )
-        original_y = max(
-            0, min(original_y, self.original_pixmap.height() - original_height)
+    def get_source_rect(self):
+        """Map the crop rectangle through the rotation onto the unrotated original"""
+        crop_rect = self.get_crop_rect()
+        if not crop_rect:
+            return None
+        return source_rect(
+            crop_rect,
+            self.rotation,
+            self.source_image.width(),
+            self.source_image.height(),
         )
 
-        return QRect(original_x, original_y, original_width, original_height)
+    def get_crop_size(self):
+        """Return the (width, height) of the crop as exported, no pixels are touched"""
+        crop_rect = self.get_crop_rect()
+        if not crop_rect:
+            return None
+        return crop_rect.width(), crop_rect.height()
 
+    @instrumentation.timed("get_cropped_image")
     def get_cropped_image(self):
-        """Return the cropped portion of the original image"""
-        if not self.original_pixmap:
+        """Return the cropped portion of the original image as a CropView"""
+        if not self.source_image:
             return None
 
-        crop_rect = self.get_crop_rect()
+        crop_rect = self.get_source_rect()
         if crop_rect:
-            return self.original_pixmap.copy(crop_rect)
+            return CropView(self.source_image, crop_rect, self.rotation)
         return None
 
+    @instrumentation.timed("rotate_image")
     def rotate_image(self, degrees, record=True):
-        """Rotate the image by specified degrees"""
-        if not self.original_pixmap:
+        """Rotate the image by a multiple of 90 degrees"""
+        if not self.source_image:
             return False
 
-        self.rotation = (self.rotation + degrees) % 360
-        transform = QTransform().rotate(degrees)
+        if degrees % 90:
+            return False
 
-        self.original_pixmap = self.original_pixmap.transformed(
-            transform, Qt.SmoothTransformation
-        )
-        self.original_size = (
-            self.original_pixmap.width(),
-            self.original_pixmap.height(),
-        )
-        self.pixmap = self.original_pixmap
+        # The original stays untouched, only the display is re-rendered
+        self.rotation = (self.rotation + degrees) % 360
+        self.reset_view()
         self.update_display()
         return True
 
+    def set_overlay_visible(self, visible):
+        """Show frame time and operation latencies, this turns instrumentation on"""
+        self.show_overlay = visible
+        if visible:
+            instrumentation.enable()
+            self.overlay_timer.start()
+        else:
+            self.overlay_timer.stop()
+        self.update(OVERLAY_RECT)
+
     def paintEvent(self, event):
-        """Draw the selection rectangle overlay"""
-        super().paintEvent(event)
-        if self.pixmap and self.show_selection:
-            painter = QPainter(self)
+        """Draw the image and the selection overlay for the invalidated area only"""
+        # The overlay refreshing itself is not a frame of the canvas
+        if not instrumentation.is_enabled() or (
+            self.show_overlay and OVERLAY_RECT.contains(event.rect())
+        ):
+            self.paint_content(event.rect())
+            if self.show_overlay:
+                self.paint_overlay()
+            return
+        start = time.perf_counter()
+        self.paint_content(event.rect())
+        instrumentation.record("paint", start, time.perf_counter() - start)
+        self.frame_times.append(start)
+        if self.show_overlay:
+            self.paint_overlay()
+
+    def paint_overlay(self):
+        """Draw the latest frame time and operation latencies in the top left corner"""
+        stats = instrumentation.stats()
+        paint = stats.get("paint")
+        lines = []
+        if paint:
+            fps = 0.0
+            if len(self.frame_times) > 1:
+                span = self.frame_times[-1] - self.frame_times[0]
+                fps = (len(self.frame_times) - 1) / span if span > 0 else 0.0
+            lines.append(f"frame {paint.last * 1000:6.1f} ms   {fps:5.1f} fps")
+        for name in OVERLAY_OPERATIONS:
+            operation = stats.get(name)
+            if operation:
+                lines.append(f"{name:<18}{operation.last * 1000:8.1f} ms  x{operation.count}")
+
+        painter = QPainter(self)
+        painter.fillRect(OVERLAY_RECT, QColor(0, 0, 0, 170))
+        painter.setPen(QColor(220, 220, 220))
+        painter.setFont(QFont("Consolas", 9))
+        painter.drawText(
+            OVERLAY_RECT.adjusted(8, 6, -8, -6), Qt.AlignLeft | Qt.AlignTop, "\n".join(lines)
+        )
+
+    def paint_content(self, dirty):
+        painter = QPainter(self)
+        painter.fillRect(dirty, BACKGROUND_COLOR)
+        if not self.source_image or not self.displayed_pixmap:
+            return
+
+        # The display pixmap is the backing surface, only the dirty part is blitted
+        image_rect = self.image_rect()
+        target = dirty.intersected(image_rect.toAlignedRect())
+        if target.isEmpty():
+            return
+        if not self.scale_index:
+            painter.drawPixmap(
+                target, self.displayed_pixmap, target.translated(-image_rect.topLeft().toPoint())
+            )
+        else:
+            self.paint_tiles(painter, image_rect, target)
+
+        if self.show_selection:
+            # Dim the image outside the selection with four plain fills
+            image_rect = image_rect.toAlignedRect().intersected(QRect(0, 0, self.width(), self.height()))
+            selection_rect = self.selection_rect()
+            selection = selection_rect.intersected(image_rect)
+            for band in (
+                QRect(image_rect.left(), image_rect.top(), image_rect.width(), selection.top() - image_rect.top()),
+                QRect(image_rect.left(), selection.bottom() + 1, image_rect.width(), image_rect.bottom() - selection.bottom()),
+                QRect(image_rect.left(), selection.top(), selection.left() - image_rect.left(), selection.height()),
+                QRect(selection.right() + 1, selection.top(), image_rect.right() - selection.right(), selection.height()),
+            ):
+                band = band.intersected(target)
+                if not band.isEmpty():
+                    painter.fillRect(band, DIM_COLOR)
+
             painter.setPen(QPen(QColor(0, 120, 215), 2))
             painter.setBrush(QColor(0, 120, 215, 30))
-            painter.drawRect(self.rect)
+            painter.drawRect(selection_rect)
+
+    def paint_tiles(self, painter, image_rect, target):
+        """Draw the zoomed image, queueing the visible tiles that are not cached yet"""
+        # The fit pixmap scaled up stands in for tiles still being rendered
+        painter.drawPixmap(image_rect, self.displayed_pixmap, QRectF(self.displayed_pixmap.rect()))
+
+        scale = self.scale()
+        columns, rows = tile_grid(self.tile_renderer.view, scale)
+        visible = QRectF(0, 0, self.width(), self.height()).intersected(image_rect)
+        visible.translate(-image_rect.topLeft())
+        keys = set()
+        for row in range(int(visible.top() // TILE_SIZE), min(rows, int(visible.bottom() // TILE_SIZE) + 1)):
+            for column in range(int(visible.left() // TILE_SIZE), min(columns, int(visible.right() // TILE_SIZE) + 1)):
+                key = (scale, column, row)
+                keys.add(key)
+                position = QPointF(
+                    image_rect.left() + column * TILE_SIZE, image_rect.top() + row * TILE_SIZE
+                )
+                if not target.intersects(QRectF(position, QSize(TILE_SIZE, TILE_SIZE)).toAlignedRect()):
+                    continue
+                tile = self.tile_cache.get(key)
+                if tile is None:
+                    self.tile_renderer.request(key)
+                else:
+                    painter.drawPixmap(position, tile)
+        self.tile_renderer.retain(keys)
 
     def get_resize_edge(self, pos):
-        if not self.rect:
+        if not self.show_selection or self.selection.isEmpty():
             return None
+        rect = self.selection_rect()
 
-        left = abs(pos.x() - self.rect.left()) <= self.resize_margin
-        right = abs(pos.x() - self.rect.right()) <= self.resize_margin
-        top = abs(pos.y() - self.rect.top()) <= self.resize_margin
-        bottom = abs(pos.y() - self.rect.bottom()) <= self.resize_margin
+        left = abs(pos.x() - rect.left()) <= self.resize_margin
+        right = abs(pos.x() - rect.right()) <= self.resize_margin
+        top = abs(pos.y() - rect.top()) <= self.resize_margin
+        bottom = abs(pos.y() - rect.bottom()) <= self.resize_margin
 
         if top and left:
             return "top_left"
@@ -202,21 +525,45 @@ class Canvas(QLabel):
         return None
 
     def mousePressEvent(self, event):
-        if not self.pixmap or not self.show_selection:
+        if not self.source_image:
             return
 
+        # Drag the zoomed image with the middle button, or with the left one off the selection
         edge = self.get_resize_edge(event.pos())
+        on_selection = self.show_selection and self.selection_rect().contains(event.pos())
+        if event.button() == Qt.MiddleButton or (
+            self.scale_index and event.button() == Qt.LeftButton and not edge and not on_selection
+        ):
+            if self.scale_index:
+                self.panning = True
+                self.last_pos = event.pos()
+                self.setCursor(Qt.ClosedHandCursor)
+            return
+        if event.button() != Qt.LeftButton:
+            return
+
         if edge:
             self.resizing = True
             self.resize_edge = edge
             self.last_pos = event.pos()
-        elif self.rect.contains(event.pos()):
+            self.last_rect = QRect(self.selection)
+        elif on_selection:
             self.dragging = True
-            self.offset = event.pos() - self.rect.topLeft()
+            self.offset = self.to_image(event.pos()) - QPointF(self.selection.topLeft())
             self.setCursor(Qt.SizeAllCursor)
 
     def mouseMoveEvent(self, event):
-        if not self.displayed_pixmap or not self.show_selection:
+        if not self.displayed_pixmap:
+            return
+
+        if self.panning:
+            self.pan -= QPointF(event.pos() - self.last_pos)
+            self.last_pos = event.pos()
+            self.clamp_pan()
+            self.update()
+            return
+
+        if not self.show_selection:
             return
 
         edge = self.get_resize_edge(event.pos())
@@ -232,69 +579,72 @@ class Canvas(QLabel):
                 "bottom_left": Qt.SizeBDiagCursor,
             }
             self.setCursor(cursors[edge])
-        elif self.rect.contains(event.pos()):
+        elif self.selection_rect().contains(event.pos()):
             self.setCursor(Qt.SizeAllCursor)
         else:
             self.setCursor(Qt.ArrowCursor)
 
+        image_width, image_height = self.image_size()
         if self.resizing and self.last_pos:
-            dx = event.pos().x() - self.last_pos.x()
-            dy = event.pos().y() - self.last_pos.y()
-
-            new_rect = QRect(self.rect)
-            image_x = (self.width() - self.displayed_pixmap.width()) // 2
-            image_y = (self.height() - self.displayed_pixmap.height()) // 2
+            # Move the grabbed edges by the mouse travel since the press, in image pixels
+            scale = self.scale()
+            dx = round((event.pos().x() - self.last_pos.x()) / scale)
+            dy = round((event.pos().y() - self.last_pos.y()) / scale)
+            minimum = max(1, round(self.resize_margin / scale))
+            start = self.last_rect
+            left, top = start.x(), start.y()
+            right, bottom = left + start.width(), top + start.height()
 
             if self.resize_edge in ["left", "top_left", "bottom_left"]:
-                new_rect.setLeft(min(max(image_x, new_rect.left() + dx),
-                                   new_rect.right() - self.resize_margin))
+                left = min(max(0, left + dx), right - minimum)
             if self.resize_edge in ["right", "top_right", "bottom_right"]:
-                new_rect.setRight(min(max(new_rect.left() + self.resize_margin,
-                                        new_rect.right() + dx),
-                                    image_x + self.displayed_pixmap.width()))
+                right = min(max(left + minimum, right + dx), image_width)
             if self.resize_edge in ["top", "top_left", "top_right"]:
-                new_rect.setTop(min(max(image_y, new_rect.top() + dy),
-                                  new_rect.bottom() - self.resize_margin))
+                top = min(max(0, top + dy), bottom - minimum)
             if self.resize_edge in ["bottom", "bottom_left", "bottom_right"]:
-                new_rect.setBottom(min(max(new_rect.top() + self.resize_margin,
-                                         new_rect.bottom() + dy),
-                                     image_y + self.displayed_pixmap.height()))
+                bottom = min(max(top + minimum, bottom + dy), image_height)
 
-            self.rect = new_rect
-            self.last_pos = event.pos()
-            crop_rect = self.get_crop_rect()
-            if crop_rect:
-                self.selection_size_changed.emit(crop_rect.width(), crop_rect.height())
-            self.update()
+            old_rect = self.selection_rect()
+            self.selection = QRect(left, top, right - left, bottom - top)
+            self.queue_selection_size(self.selection.width(), self.selection.height())
+            self.update_selection(old_rect)
 
         elif self.dragging:
-            new_pos = event.pos() - self.offset
-            image_x = (self.width() - self.displayed_pixmap.width()) // 2
-            image_y = (self.height() - self.displayed_pixmap.height()) // 2
-
-            new_x = max(image_x,
-                       min(new_pos.x(),
-                           image_x + self.displayed_pixmap.width() - self.rect.width()))
-            new_y = max(image_y,
-                       min(new_pos.y(),
-                           image_y + self.displayed_pixmap.height() - self.rect.height()))
-
-            self.rect.moveTopLeft(QPoint(new_x, new_y))
-            self.update()
+            position = self.to_image(event.pos()) - self.offset
+            new_x = max(0, min(round(position.x()), image_width - self.selection.width()))
+            new_y = max(0, min(round(position.y()), image_height - self.selection.height()))
+
+            old_rect = self.selection_rect()
+            self.selection.moveTopLeft(QPoint(new_x, new_y))
+            self.update_selection(old_rect)
 
     def mouseReleaseEvent(self, event):
         if self.resizing:
+            # The final size always goes out, even if a frame is still pending
             crop_rect = self.get_crop_rect()
             if crop_rect:
-                self.selection_size_changed.emit(crop_rect.width(), crop_rect.height())
+                self.pending_size = (crop_rect.width(), crop_rect.height())
+                self.size_updates_requested += 1
+            self.flush_selection_size()
+        if self.panning:
+            self.unsetCursor()
 
         self.dragging = False
         self.resizing = False
+        self.panning = False
         self.resize_edge = None
         self.last_pos = None
 
+    def wheelEvent(self, event):
+        """Zoom in or out around the mouse position"""
+        if not self.source_image or not event.angleDelta().y():
+            return
+        step = 1 if event.angleDelta().y() > 0 else -1
+        self.zoom_to(self.scale_index + step, event.position())
+        event.accept()
+
     def resizeEvent(self, event):
         """Handle window resize events"""
         super().resizeEvent(event)
-        if self.pixmap:
+        if self.source_image:
             self.update_display()
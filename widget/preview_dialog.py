@@ -2,10 +2,16 @@ from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel
 from PySide6.QtCore import Qt, QPoint
 from PySide6.QtGui import QMouseEvent
 
+from widget.zoom_view import ZoomView
+
 class PreviewDialog(QDialog):
-    """Dialog for previewing the cropped image"""
+    """Dialog for previewing the cropped image
+
+    Given the CropView and the display pyramid of the source, the preview
+    zooms with the mouse wheel, +/- and 0/1 and pans by dragging.
+    """
 
-    def __init__(self, pixmap, parent=None):
+    def __init__(self, pixmap, parent=None, view=None, pyramid=None):
         super().__init__(parent)
         self.setWindowTitle("Preview")
         self.setFixedSize(800, 600)
@@ -28,17 +34,31 @@ class PreviewDialog(QDialog):
 
 
         layout = QVBoxLayout()
-        preview_label = QLabel()
-        preview_label.setAlignment(Qt.AlignCenter)
-        scaled_pixmap = pixmap.scaled(780, 580, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        preview_label.setPixmap(scaled_pixmap)
-        layout.addWidget(preview_label)
+        self.zoom_view = None
+        if view is not None:
+            self.zoom_view = ZoomView(self)
+            self.zoom_view.set_source(view, pyramid, pixmap)
+            layout.addWidget(self.zoom_view)
+        else:
+            self.preview_label = QLabel()
+            self.preview_label.setAlignment(Qt.AlignCenter)
+            self.set_pixmap(pixmap)
+            layout.addWidget(self.preview_label)
 
         self.setLayout(layout)
         self._dragging = False
         self._offset = QPoint()
 
 
+    def set_pixmap(self, pixmap):
+        """Show a pixmap, e.g. a refined version of the current preview"""
+        if self.zoom_view is not None:
+            self.zoom_view.set_pixmap(pixmap)
+            return
+        if pixmap.width() > 780 or pixmap.height() > 580:
+            pixmap = pixmap.scaled(780, 580, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.preview_label.setPixmap(pixmap)
+
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.LeftButton:
             self._dragging = True
@@ -161,3 +161,25 @@ class Styles:
             background-color: #e81123;
         }
     """
+
+    THUMBNAIL_STRIP = """
+        QListView {
+            background-color: #232323;
+            border: 1px solid #3c3c3c;
+            border-radius: 5px;
+            color: white;
+            font-family: "Microsoft YaHei", "微软雅黑", sans-serif;
+            font-size: 12px;
+            font-weight: 500;
+        }
+        QListView::item {
+            padding: 4px;
+            border-radius: 3px;
+        }
+        QListView::item:hover {
+            background-color: #3b3b3b;
+        }
+        QListView::item:selected {
+            background-color: #0078d7;
+        }
+    """
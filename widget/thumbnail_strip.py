@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, Signal
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import QListView, QAbstractItemView
+
+from widget.styles import Styles
+
+
+class ThumbnailModel(QAbstractListModel):
+    """List of image paths whose thumbnails are requested only when shown"""
+
+    def __init__(self, loader, parent=None, max_cached=2000):
+        super().__init__(parent)
+        self.loader = loader
+        self.loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.paths = []
+        self.rows = {}
+        self.max_cached = max_cached
+        self.thumbnails = OrderedDict()
+
+    def set_paths(self, paths):
+        self.beginResetModel()
+        self.loader.clear()
+        self.paths = list(paths)
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.DecorationRole:
+            # The view only asks for visible rows, so this is what keeps
+            # thumbnail generation limited to what is on screen
+            pixmap = self.thumbnails.get(path)
+            if pixmap is None:
+                self.loader.request(path)
+            else:
+                self.thumbnails.move_to_end(path)
+            return pixmap
+        return None
+
+    def on_thumbnail_ready(self, path, image):
+        row = self.rows.get(path)
+        if row is None or image.isNull():
+            return
+        self.thumbnails[path] = QPixmap.fromImage(image)
+        while len(self.thumbnails) > self.max_cached:
+            self.thumbnails.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ThumbnailStrip(QListView):
+    """Horizontal, virtualized strip of thumbnails for the opened images"""
+
+    image_activated = Signal(int)
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.thumbnail_model = ThumbnailModel(loader, self)
+        self.setModel(self.thumbnail_model)
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setUniformItemSizes(True)
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setIconSize(QSize(96, 96))
+        self.setGridSize(QSize(120, 124))
+        self.setFixedHeight(150)
+        self.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setStyleSheet(Styles.THUMBNAIL_STRIP)
+        self.clicked.connect(lambda index: self.image_activated.emit(index.row()))
+
+    def set_paths(self, paths):
+        self.thumbnail_model.set_paths(paths)
+        self.setVisible(len(paths) > 1)
+
+    def set_current(self, row):
+        index = self.thumbnail_model.index(row)
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
@@ -4,13 +4,13 @@ from PySide6.QtWidgets import (
     QScrollArea, QFrame, QMessageBox, QSplitter
 )
 from PySide6.QtCore import Qt, Signal, QSize, QUrl
-from PySide6.QtGui import QPixmap, QIcon
+from PySide6.QtGui import QImage, QIcon
 from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtWebEngineCore import QWebEngineProfile, QWebEngineUrlRequestInterceptor
 import os
 import json
-import requests
-from io import BytesIO
+from core.downloader import ImageDownloader
+from core.web_cache import WebImageCache
 
 class WebSite:
     def __init__(self, name, icon, url, search_api=None):
@@ -31,7 +31,7 @@ class ImageUrlInterceptor(QWebEngineUrlRequestInterceptor):
             self.clicked_images.append(url)
 
 class WebImportDialog(QDialog):
-    image_selected = Signal(QPixmap)
+    image_selected = Signal(QImage)
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -53,6 +53,14 @@ class WebImportDialog(QDialog):
         # Create a QWebEngineProfile for the web view
         self.profile = QWebEngineProfile("WebImportDialogProfile", self)
         self.profile.setUrlRequestInterceptor(self.interceptor)
+
+        # Downloads run on a worker thread with a pooled keep-alive session
+        self.cache = self.load_cache()
+        self.downloader = ImageDownloader(self, cache=self.cache)
+        self.downloader.progress.connect(self.download_progress)
+        self.downloader.finished.connect(self.download_finished)
+        self.downloader.failed.connect(self.download_failed)
+        self.rejected.connect(self.downloader.cancel)
     
     def load_websites_config(self):
         config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'websites.json')
@@ -78,6 +86,16 @@ class WebImportDialog(QDialog):
             
         return websites
     
+    def load_cache(self):
+        root = os.path.dirname(os.path.dirname(__file__))
+        max_mb = 512
+        try:
+            with open(os.path.join(root, 'config.json'), 'r', encoding='utf-8') as f:
+                max_mb = json.load(f).get('web_cache_max_mb', max_mb)
+        except (OSError, ValueError):
+            pass
+        return WebImageCache(os.path.join(root, 'cache', 'web'), max_bytes=max_mb * 1024 * 1024)
+
     def init_ui(self):
         main_layout = QVBoxLayout(self)
         
@@ -213,20 +231,26 @@ class WebImportDialog(QDialog):
             self.interceptor.clicked_images.clear()
             
     def download_and_select_image(self, url):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            img_data = BytesIO(response.content)
-            pixmap = QPixmap()
-            
-            if pixmap.loadFromData(response.content):
-                self.status_label.setText(f"Image downloaded: {url}")
-                self.image_selected.emit(pixmap)
-                self.accept()
-            else:
-                self.status_label.setText(f"Failed to load image from: {url}")
-                
-        except Exception as e:
-            self.status_label.setText(f"Error downloading image: {str(e)}")
-            QMessageBox.warning(self, "Download Error", str(e))
+        self.status_label.setText(f"Downloading image: {url}")
+        self.downloader.download(url)
+
+    def download_progress(self, received, total):
+        if total:
+            self.status_label.setText(
+                f"Downloading image: {received // 1024} / {total // 1024} KB"
+            )
+        else:
+            self.status_label.setText(f"Downloading image: {received // 1024} KB")
+
+    def download_finished(self, url, image):
+        stats = self.cache.stats()
+        self.status_label.setText(
+            f"Image downloaded: {url} (cache hit rate {stats['hit_rate']:.0%}, "
+            f"{stats['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+        self.image_selected.emit(image)
+        self.accept()
+
+    def download_failed(self, url, message):
+        self.status_label.setText(f"Error downloading image: {message}")
+        QMessageBox.warning(self, "Download Error", message)
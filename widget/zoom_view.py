@@ -0,0 +1,207 @@
+from PySide6.QtCore import Qt, QPointF, QRectF, Signal
+from PySide6.QtGui import QColor, QPainter, QPixmap
+from PySide6.QtWidgets import QWidget
+
+from core.tiles import TILE_SIZE, TileCache, TileRenderer, scaled_size, tile_grid, zoom_scales
+
+
+BACKGROUND_COLOR = QColor(44, 44, 44)
+
+# Tiles kept across zoom levels, about 500 full tiles
+TILE_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class ZoomView(QWidget):
+    """Zoomable, pannable view of a CropView
+
+    At the fit zoom the given pixmap is shown as is. Closer zooms are drawn
+    from tiles rendered on worker threads, only for the visible area, and
+    the pixmap scaled up fills in wherever a tile is not ready yet.
+    """
+
+    zoom_changed = Signal(float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.view = None
+        self.pyramid = None
+        self.pixmap = QPixmap()
+        self.scale_index = 0
+        self.origin = QPointF(0, 0)
+        self.last_pos = None
+        self.cache = TileCache(TILE_CACHE_BYTES)
+        self.renderer = TileRenderer(self)
+        self.renderer.tile_ready.connect(self.on_tile_ready)
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def set_source(self, view, pyramid, pixmap):
+        """Show a CropView, pixmap is its preview at the fit zoom"""
+        self.view = view
+        self.pyramid = pyramid
+        self.pixmap = pixmap
+        self.cache.clear()
+        self.renderer.set_source(view, pyramid)
+        self.scale_index = 0
+        self.origin = QPointF(0, 0)
+        self.update()
+
+    def set_pixmap(self, pixmap):
+        """Replace the fit zoom preview, e.g. with a refined one"""
+        self.pixmap = pixmap
+        self.update()
+
+    def fit_scale(self):
+        if self.view is None:
+            return 1.0
+        width, height = self.view.size()
+        return min(self.width() / width, self.height() / height)
+
+    def scales(self):
+        return zoom_scales(self.fit_scale())
+
+    def scale(self):
+        scales = self.scales()
+        return scales[min(self.scale_index, len(scales) - 1)]
+
+    def image_rect(self):
+        """Return where the scaled crop lies in widget coordinates"""
+        width, height = scaled_size(self.view, self.scale())
+        left = (self.width() - width) / 2 if width < self.width() else -self.origin.x()
+        top = (self.height() - height) / 2 if height < self.height() else -self.origin.y()
+        return QRectF(left, top, width, height)
+
+    def clamp_origin(self):
+        width, height = scaled_size(self.view, self.scale())
+        self.origin = QPointF(
+            max(0, min(self.origin.x(), width - self.width())),
+            max(0, min(self.origin.y(), height - self.height())),
+        )
+
+    def zoom_to(self, index, anchor=None):
+        """Zoom to a step of scales(), keeping the point under anchor in place"""
+        if self.view is None:
+            return
+        index = max(0, min(index, len(self.scales()) - 1))
+        if index == self.scale_index:
+            return
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        old_rect = self.image_rect()
+        old_scale = self.scale()
+        point = (anchor - old_rect.topLeft()) / old_scale
+
+        self.scale_index = index
+        self.origin = point * self.scale() - anchor
+        self.clamp_origin()
+        self.update()
+        self.zoom_changed.emit(self.scale())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), BACKGROUND_COLOR)
+        if self.view is None:
+            return
+        target = self.image_rect()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        if not self.pixmap.isNull():
+            painter.drawPixmap(target, self.pixmap, QRectF(self.pixmap.rect()))
+        if self.scale_index == 0:
+            return
+
+        # Visible tiles only, anything missing keeps showing the scaled preview
+        scale = self.scale()
+        columns, rows = tile_grid(self.view, scale)
+        visible = QRectF(self.rect()).intersected(target).translated(-target.topLeft())
+        first_column = int(visible.left() // TILE_SIZE)
+        last_column = min(columns - 1, int(visible.right() // TILE_SIZE))
+        first_row = int(visible.top() // TILE_SIZE)
+        last_row = min(rows - 1, int(visible.bottom() // TILE_SIZE))
+        keys = set()
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                key = (scale, column, row)
+                keys.add(key)
+                tile = self.cache.get(key)
+                if tile is None:
+                    self.renderer.request(key)
+                else:
+                    painter.drawPixmap(
+                        QPointF(target.left() + column * TILE_SIZE, target.top() + row * TILE_SIZE),
+                        tile,
+                    )
+        self.renderer.retain(keys)
+
+        painter.setPen(QColor(220, 220, 220))
+        painter.drawText(
+            self.rect().adjusted(8, 8, -8, -8), Qt.AlignRight | Qt.AlignBottom, f"{scale * 100:.0f}%"
+        )
+
+    def on_tile_ready(self, key, image):
+        self.cache.put(key, QPixmap.fromImage(image))
+        if key[0] == self.scale():
+            self.update()
+
+    def resizeEvent(self, event):
+        if self.view is not None:
+            self.clamp_origin()
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event):
+        if self.view is None or not event.angleDelta().y():
+            return
+        step = 1 if event.angleDelta().y() > 0 else -1
+        self.zoom_to(self.scale_index + step, event.position())
+        event.accept()
+
+    def mouseDoubleClickEvent(self, event):
+        """Toggle between fit and 100%, or the closest zoom above 100%"""
+        if self.view is None or event.button() != Qt.LeftButton:
+            return
+        if self.scale_index:
+            self.zoom_to(0)
+        else:
+            scales = self.scales()
+            index = next((i for i, scale in enumerate(scales) if i and scale >= 1), len(scales) - 1)
+            self.zoom_to(index, event.position())
+
+    def mousePressEvent(self, event):
+        # At the fit zoom there is nothing to pan, the dialog is dragged instead
+        if self.scale_index and event.button() == Qt.LeftButton:
+            self.last_pos = event.position()
+            self.setCursor(Qt.ClosedHandCursor)
+            event.accept()
+        else:
+            super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self.last_pos is not None:
+            self.origin -= event.position() - self.last_pos
+            self.last_pos = event.position()
+            self.clamp_origin()
+            self.update()
+            event.accept()
+        else:
+            super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.last_pos is not None and event.button() == Qt.LeftButton:
+            self.last_pos = None
+            self.unsetCursor()
+            event.accept()
+        else:
+            super().mouseReleaseEvent(event)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key in (Qt.Key_Plus, Qt.Key_Equal):
+            self.zoom_to(self.scale_index + 1)
+        elif key == Qt.Key_Minus:
+            self.zoom_to(self.scale_index - 1)
+        elif key == Qt.Key_0:
+            self.zoom_to(0)
+        elif key == Qt.Key_1:
+            scales = self.scales()
+            self.zoom_to(scales.index(1.0) if 1.0 in scales else len(scales) - 1)
+        else:
+            super().keyPressEvent(event)